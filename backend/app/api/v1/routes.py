@@ -1,22 +1,169 @@
-from fastapi import APIRouter, Query
+import json, math
+from fastapi import APIRouter, Header, HTTPException, Query, Request, WebSocket
+from fastapi.responses import Response, StreamingResponse
 from datetime import datetime
-from typing import Optional
-from app.services import aqi_summary, geojson, sensor_counts
+from typing import List, Literal, Optional
+from app.services import aqi_summary, geojson, ingest, live, map_summary, sensor_counts
+from app.services.storage import get_backend
+from app.services.downsample import AGGS, BUCKETS
+from app.utils import concurrency, timing
+from app.utils.concurrency import QUERY_WORKERS
 
 router = APIRouter()
 
+# handlers are async and hand their blocking work to a gate: summaries run on the
+# bounded query pool, cheap lookups and ingest parsing on the default executor,
+# so a burst of heavy queries can't hold every thread /geojson or /health need
+AQI_SUMMARY = concurrency.gate("aqi-summary", QUERY_WORKERS)
+MAP_SUMMARY = concurrency.gate("map-summary", max(1, QUERY_WORKERS // 2))
+GEOJSON = concurrency.gate("geojson", 8, heavy=False)
+SENSORS = concurrency.gate("sensors", 8, heavy=False)
+READINGS = concurrency.gate("readings", 4, heavy=False)
+
+async def _run(gate, key, fn, *args):
+    # identical in-flight calls (same key) share one computation; key=None never coalesces.
+    # a profiled request always computes its own, under the profiler
+    if timing.profiling():
+        key, fn = None, timing.profiled(fn)
+    try:
+        return await gate.run(key, fn, *args)
+    except concurrency.Overloaded:
+        raise HTTPException(503, f"too many {gate.name} requests queued; retry shortly", headers={"Retry-After": "1"})
+
+def _json(fn, *args):
+    # encode in the worker, not in the response class on the event loop
+    doc = fn(*args)
+    with timing.phase("encode"):
+        return json.dumps(doc, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+def _negotiate(format, accept):
+    # an explicit ?format= wins; otherwise honour the Accept header
+    if format != "json" or not accept:
+        return format
+    if aqi_summary.ARROW_STREAM in accept:
+        return "arrow"
+    if aqi_summary.COLUMNAR_JSON in accept:
+        return "columnar"
+    return format
+
+def _aqi_summary(start, end, zip, sensor, format, bucket, agg, max_points):
+    """(body bytes, media type) for the non-streamed /aqi-summary formats."""
+    if format == "arrow":
+        return aqi_summary.get_arrow(start, end, zip, sensor), aqi_summary.ARROW_STREAM
+    if format == "columnar":
+        return aqi_summary.get_columnar(start, end, zip, sensor), aqi_summary.COLUMNAR_JSON
+    return _json(aqi_summary.get_summary, start, end, zip, bucket, agg, max_points, sensor), "application/json"
+
 @router.get("/aqi-summary")
-def get_aqi_summary(
+async def get_aqi_summary(
     start: datetime = Query(..., description="ISO time"),
     end: datetime = Query(..., description="ISO time"),
-    zip: Optional[str] = Query(None)
+    zip: Optional[str] = Query(None),
+    sensor: Optional[str] = Query(None, description="readings of this sensor_id only"),
+    format: Literal["json", "ndjson", "columnar", "arrow"] = Query(
+        "json", description="ndjson streams one reading per line; columnar/arrow are column-oriented"),
+    stream: bool = Query(False, description="stream the json response in chunks"),
+    bucket: Optional[Literal[tuple(BUCKETS)]] = Query(None, description="aggregate per zip and time bucket"),
+    agg: Literal[AGGS] = Query("mean", description="aggregate used with bucket"),
+    max_points: Optional[int] = Query(None, ge=3, description="LTTB-downsample to about this many points"),
+    accept: Optional[str] = Header(None),
 ):
-    return aqi_summary.get_summary(start, end, zip)
+    format = _negotiate(format, accept)
+    if (bucket or max_points) and (format != "json" or stream):
+        raise HTTPException(400, "bucket/max_points are only supported for format=json")
+    if stream or format == "ndjson":
+        # a body generator can't be shared, so streamed responses are never coalesced
+        body, media_type = await _run(AQI_SUMMARY, None, aqi_summary.stream_summary, start, end, zip, format, sensor)
+        return StreamingResponse(body, media_type=media_type)
+    args = (start, end, zip, sensor, format, bucket, agg, max_points)
+    try:
+        content, media_type = await _run(AQI_SUMMARY, args, _aqi_summary, *args)
+    except ImportError:
+        raise HTTPException(406, "Arrow responses need pyarrow installed")
+    return Response(content, media_type=media_type)
+
+@router.get("/map-summary")
+async def get_map_summary(start: datetime = Query(..., description="ISO time"), end: datetime = Query(..., description="ISO time")):
+    content = await _run(MAP_SUMMARY, (start, end), _json, map_summary.get_map_summary, start, end)
+    return Response(content, media_type="application/json")
 
 @router.get("/geojson")
-def get_geojson():
-    return geojson.get_zip_geojson()
+async def get_geojson(
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="simplify boundaries for this map zoom level"),
+    quantize: bool = Query(False, description="round coordinates to the zoom's pixel grid"),
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+):
+    # served from bytes encoded once per file version and zoom; compressed variants by Accept-Encoding
+    gj = await _run(GEOJSON, (zoom, quantize), geojson.get_encoded, zoom, quantize)
+    enc = gj.negotiate(accept_encoding)
+    headers = {"ETag": gj.etags[enc], "Vary": "Accept-Encoding"}
+    if enc != "identity":
+        headers["Content-Encoding"] = enc
+    if if_none_match and (if_none_match.strip() == "*" or gj.etags[enc] in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return Response(gj.variants[enc], media_type="application/geo+json", headers=headers)
 
 @router.get("/sensor-counts")
-def get_sensor_counts(zip: str = Query(...)):
-    return sensor_counts.get_counts(zip)
+async def get_sensor_counts(zip: Optional[List[str]] = Query(None, description="repeat for several zips; omit for all")):
+    key = ("counts", tuple(zip or ()))
+    return Response(await _run(SENSORS, key, _json, sensor_counts.get_counts, zip), media_type="application/json")
+
+def _sensors(zip, model, install_date, bbox):
+    # the backend's registry, so /sensors and /sensor-counts agree on which sensors exist
+    return {"sensors": get_backend().sensors().query(zip, model, install_date, bbox)}
+
+@router.get("/sensors")
+async def get_sensors(
+    bbox: Optional[str] = Query(None, description="minLon,minLat,maxLon,maxLat"),
+    zip: Optional[str] = Query(None),
+    model: Optional[str] = Query(None),
+    install_date: Optional[str] = Query(None),
+):
+    if bbox is not None:
+        try:
+            bbox = tuple(float(v) for v in bbox.split(","))
+            # nan/inf would break the grid's cell arithmetic, and an inverted box matches nothing
+            if len(bbox) != 4 or not all(math.isfinite(v) for v in bbox) or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+                raise ValueError
+        except ValueError:
+            raise HTTPException(400, "bbox must be minLon,minLat,maxLon,maxLat")
+    args = (zip, model, install_date, bbox)
+    return Response(await _run(SENSORS, ("sensors", *args), _json, _sensors, *args), media_type="application/json")
+
+@router.post("/readings", status_code=202)
+async def post_readings(
+    request: Request,
+    content_type: Optional[str] = Header(None),
+    wait: bool = Query(False, description="flush before responding, so the readings show up in the next read"),
+):
+    # NDJSON or CSV; parsing and the flush run off the event loop
+    if get_backend().name != "memory":
+        raise HTTPException(501, "ingest is only supported by the memory backend")
+    fmt = ingest.FORMATS.get((content_type or "").split(";")[0].strip().lower())
+    if fmt is None:
+        raise HTTPException(415, f"Content-Type must be one of {', '.join(ingest.FORMATS)}")
+    body = await request.body()
+    try:
+        return await _run(READINGS, None, ingest.ingest, body, fmt, wait)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+@router.get("/live/events")
+def get_live_events(
+    zip: Optional[List[str]] = Query(None, description="repeat for several zips; omit both filters for every zip"),
+    sensor: Optional[List[str]] = Query(None, description="repeat for several sensors"),
+):
+    # Server-Sent Events: "zip" events carry new readings plus the hourly aggregates they changed
+    return StreamingResponse(live.sse(zip or (), sensor or ()), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.websocket("/live/ws")
+async def live_ws(
+    websocket: WebSocket,
+    zip: Optional[List[str]] = Query(None),
+    sensor: Optional[List[str]] = Query(None),
+):
+    # same messages as /live/events, one JSON text frame each
+    await websocket.accept()
+    await live.pump(websocket, zip or (), sensor or ())
@@ -1,8 +1,35 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from app.api.v1.routes import router as api_router
+from app.services import ingest, storage, warmup
+from app.utils import concurrency, metrics
+from app.utils.cache import CacheMiddleware, ResponseCache
+from app.utils.timing import TimingMiddleware
 
-app = FastAPI(title="FHA Air Quality API")
+@asynccontextmanager
+async def lifespan(app):
+    # datasets load in the background so /health answers at once; /ready says when they're in
+    warming = asyncio.create_task(asyncio.to_thread(warmup.warm))
+    yield
+    await warming  # a thread can't be cancelled; let a warm-up still loading finish first
+    ingest.close()  # don't drop readings still waiting for a flush
+    concurrency.pool.shutdown()
+
+app = FastAPI(title="FHA Air Quality API", lifespan=lifespan)
+
+# cached responses are keyed on each route's data version; added before CORS so
+# CORS headers are applied per request rather than stored with the entry.
+# /geojson is not listed: it keeps its own pre-encoded variants per Accept-Encoding
+app.state.response_cache = ResponseCache()
+app.add_middleware(CacheMiddleware, cache=app.state.response_cache, versions={
+    "/api/v1/aqi-summary": lambda: storage.get_backend().data_version(),
+    "/api/v1/sensor-counts": lambda: storage.get_backend().data_version(),
+    "/api/v1/map-summary": lambda: storage.get_backend().data_version(),
+    "/api/v1/sensors": lambda: storage.get_backend().data_version(),
+})
 
 origins = ["http://localhost:3000","http://localhost:8081","*"]  # relax for dev
 app.add_middleware(
@@ -11,8 +38,42 @@ app.add_middleware(
     allow_methods=["*"], allow_headers=["*"],
 )
 
+# outermost, so cache hits and CORS preflights are timed too (see app.utils.timing)
+app.add_middleware(TimingMiddleware)
+
 app.include_router(api_router, prefix="/api/v1")
 
+# existing counters, read when /metrics renders
+for field, kind, help in [("hits", metrics.Counter, "Response cache hits"),
+                          ("misses", metrics.Counter, "Response cache misses"),
+                          ("evictions", metrics.Counter, "Response cache evictions"),
+                          ("entries", metrics.Gauge, "Responses held in the cache"),
+                          ("bytes", metrics.Gauge, "Bytes held in the response cache")]:
+    kind(f"fha_response_cache_{field}{'_total' if kind is metrics.Counter else ''}", help,
+         fn=lambda field=field: {(): app.state.response_cache.stats()[field]})
+for field, kind, help in [("active", metrics.Gauge, "Calls running under each route gate"),
+                          ("waiting", metrics.Gauge, "Calls queued behind each route gate"),
+                          ("coalesced", metrics.Counter, "Calls answered by an identical call in flight"),
+                          ("rejected", metrics.Counter, "Calls refused with 503 because the gate's queue was full")]:
+    kind(f"fha_gate_{field}{'_total' if kind is metrics.Counter else ''}", help, ("gate",),
+         fn=lambda field=field: {(name,): g.stats()[field] for name, g in concurrency.gates.items()})
+
 @app.get("/health")
-def health():
+async def health():
     return {"ok": True}
+
+@app.get("/ready")
+async def ready():
+    # readiness, separate from liveness: 503 until the warm-up has loaded every dataset
+    status = warmup.readiness.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/stats")
+async def stats():
+    # queue depths per route gate and for the query pool, plus response cache counters
+    return {"queues": concurrency.stats(), "cache": app.state.response_cache.stats()}
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text format: latency histograms, phases, rows, cache and dataset loads
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -1,19 +1,77 @@
-import os, pandas as pd
-
-DATA_DIR = os.getenv("DATA_DIR", "./data")
-CSV = os.path.join(DATA_DIR, "processed", "aqi_timeseries.csv")
-
-def get_summary(start, end, zip=None):
-    df = pd.read_csv(CSV, parse_dates=["timestamp"])
-    start = pd.to_datetime(start); end = pd.to_datetime(end)
-    m = (df["timestamp"] >= start) & (df["timestamp"] <= end)
-    if zip:
-        m &= (df["zip"] == zip)
-    df = df.loc[m, ["timestamp", "zip", "sensor_id", "pm25", "aqi"]].sort_values("timestamp")
-
-    stats = {
-        "mean": float(df["aqi"].mean()) if not df.empty else None,
-        "p95": float(df["aqi"].quantile(0.95)) if not df.empty else None,
-        "max": float(df["aqi"].max()) if not df.empty else None,
-    }
-    return {"timeseries": df.to_dict(orient="records"), "stats": stats, "meta": {"source": "synthetic"}}
+import json
+from app.services.downsample import downsample
+from app.services.storage import get_backend
+from app.utils import timing
+
+META = {"source": "synthetic"}
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+COLUMNAR_JSON = "application/vnd.fha.columnar+json"
+
+def get_summary(start, end, zip=None, bucket=None, agg="mean", max_points=None, sensor=None):
+    """Readings in [start, end] (of one zip and/or sensor when given); optionally aggregated
+    per (zip, bucket) and/or thinned to about ``max_points`` rows. ``stats`` always cover the
+    raw readings.
+
+    Bucketed responses never load the window's raw readings: rows and stats
+    come from the rollups, and their p95 values are sketch estimates
+    (app.utils.sketch documents the error bound).
+    """
+    backend = get_backend()
+    if bucket:
+        with backend.snapshot():
+            rows = backend.buckets(start, end, zip, bucket, agg, sensor)
+            stats = backend.stats(start, end, zip, sensor)
+    else:
+        rows, stats = backend.summary(start, end, zip, sensor)
+    if max_points:
+        with timing.phase("downsample"):
+            rows = downsample(rows, max_points)
+    timing.rows(returned=len(rows))
+    with timing.phase("records"):
+        records = rows.records()
+    return {"timeseries": records, "stats": stats, "meta": META}
+
+def stream_summary(start, end, zip=None, format="json", sensor=None):
+    """(byte chunks, media type) for a streamed response.
+
+    ``json`` is the same document as get_summary written out in chunks;
+    ``ndjson`` is a {"stats", "meta"} header line followed by one line per reading.
+    """
+    sel, stats = get_backend().summary(start, end, zip, sensor)
+    timing.rows(returned=len(sel))
+    if format == "ndjson":
+        def body():
+            yield (json.dumps({"stats": stats, "meta": META}) + "\n").encode()
+            for rows in sel.json_rows():
+                yield ("\n".join(rows) + "\n").encode()
+        return body(), "application/x-ndjson"
+
+    def body():
+        yield b'{"timeseries":['
+        sep = ""
+        for rows in sel.json_rows():
+            yield (sep + ",".join(rows)).encode()
+            sep = ","
+        yield f'],"stats":{json.dumps(stats)},"meta":{json.dumps(META)}}}'.encode()
+    return body(), "application/json"
+
+def get_columnar(start, end, zip=None, sensor=None):
+    """Encoded column-oriented JSON (see Selection.columns)."""
+    sel, stats = get_backend().summary(start, end, zip, sensor)
+    timing.rows(returned=len(sel))
+    with timing.phase("records"):
+        doc = {"timeseries": sel.columns(), "stats": stats, "meta": META}
+    with timing.phase("encode"):
+        return json.dumps(doc, separators=(",", ":")).encode()
+
+def get_arrow(start, end, zip=None, sensor=None):
+    """Arrow IPC stream bytes; stats/meta travel as schema metadata."""
+    import pyarrow as pa
+    sel, stats = get_backend().summary(start, end, zip, sensor)
+    timing.rows(returned=len(sel))
+    with timing.phase("encode"):
+        table = sel.to_arrow().replace_schema_metadata({"stats": json.dumps(stats), "meta": json.dumps(META)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=64_000)
+        return sink.getvalue().to_pybytes()
@@ -0,0 +1,113 @@
+import numpy as np
+from app.services.timeseries import _f32_to_py, _iso
+
+S = 1_000_000_000
+BUCKETS = {"10m": 600 * S, "1h": 3600 * S, "1d": 86400 * S, "1w": 7 * 86400 * S}
+AGGS = ("mean", "max", "p95")
+WEEK_ORIGIN = 4 * 86400 * S  # 1970-01-05, a Monday; other buckets align to the epoch
+
+
+def _py(a):
+    # the inputs are float32, so report aggregates at float32 precision too
+    return _f32_to_py(a.astype(np.float32))
+
+
+class Buckets:
+    """Per (zip, time bucket) aggregates, ordered by bucket start then zip."""
+
+    def __init__(self, ts, zip_codes, zips, pm25, aqi, count):
+        self.ts, self.zip_codes, self.zips = ts, zip_codes, zips
+        self.pm25, self.aqi, self.count = pm25, aqi, count
+
+    def __len__(self):
+        return len(self.ts)
+
+    @classmethod
+    def concat(cls, parts):
+        cols = [np.concatenate([getattr(p, f) for p in parts]) for f in ("ts", "zip_codes", "pm25", "aqi", "count")]
+        return cls(cols[0], cols[1], parts[0].zips, *cols[2:])
+
+    def take(self, idx):
+        return Buckets(self.ts[idx], self.zip_codes[idx], self.zips, self.pm25[idx], self.aqi[idx], self.count[idx])
+
+    def records(self):
+        cols = zip(_iso(self.ts), self.zips[self.zip_codes].tolist(), _py(self.pm25), _py(self.aqi),
+                   self.count.tolist())
+        return [{"timestamp": t, "zip": z, "pm25": p, "aqi": q, "count": n} for t, z, p, q, n in cols]
+
+
+def _group_quantile(values, group, starts, counts, q):
+    # linear interpolation (numpy's default) within each group of a group-sorted array
+    v = values[np.lexsort((values, group))].astype(np.float64)
+    pos = (counts - 1) * q
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, counts - 1)
+    frac = pos - lo
+    return v[starts + lo] * (1 - frac) + v[starts + hi] * frac
+
+
+def _reduce(values, group, starts, counts, agg):
+    if agg == "mean":
+        return np.add.reduceat(values.astype(np.float64), starts) / counts
+    if agg == "max":
+        return np.maximum.reduceat(values, starts)
+    return _group_quantile(values, group, starts, counts, 0.95)
+
+
+def bucketize(sel, bucket, agg="mean"):
+    """Group a Selection by (zip, bucket) and aggregate pm25/aqi with ``agg``."""
+    width = BUCKETS[bucket]
+    origin = WEEK_ORIGIN if bucket == "1w" else 0
+    if not len(sel):
+        empty = np.empty(0, np.int64)
+        return Buckets(empty, empty.astype(np.int32), sel.zips, empty.astype(np.float64),
+                       empty.astype(np.float64), empty)
+    b = (sel.ts - origin) // width
+    key = sel.zip_codes.astype(np.int64) << 40 | (b - b.min())
+    # store selections for one zip are already in key order; only sort when needed
+    if (np.diff(key) < 0).any():
+        order = np.argsort(key, kind="stable")
+        sel, key, b = sel.take(order), key[order], b[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    counts = np.diff(np.r_[starts, len(key)])
+    group = np.repeat(np.arange(len(starts)), counts)
+    out = Buckets(b[starts] * width + origin, sel.zip_codes[starts], sel.zips,
+                  _reduce(sel.pm25, group, starts, counts, agg), _reduce(sel.aqi, group, starts, counts, agg),
+                  counts)
+    return out.take(np.argsort(out.ts, kind="stable"))
+
+
+def lttb(x, y, n):
+    """Indices of ``n`` points picked by Largest-Triangle-Three-Buckets."""
+    m = len(x)
+    if n >= m or n < 3:
+        return np.arange(m)
+    x, y = np.asarray(x, np.float64), np.asarray(y, np.float64)
+    edges = np.linspace(1, m - 1, n - 1).astype(np.int64)  # n - 2 buckets between the end points
+    nxt = np.r_[edges[1:], m]
+    nxt_end = np.r_[edges[2:], m, m]
+    sizes = nxt_end[:-1] - nxt[:-1]
+    avg_x = np.add.reduceat(x, nxt[:-1]) / sizes
+    avg_y = np.add.reduceat(y, nxt[:-1]) / sizes
+    out = np.empty(n, np.int64)
+    out[0], out[-1] = 0, m - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i] - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def downsample(rows, max_points):
+    """Thin ``rows`` (a Selection or Buckets) to about max_points, shared across zips via LTTB on aqi."""
+    if len(rows) <= max_points:
+        return rows
+    codes = np.unique(rows.zip_codes)
+    budget = max(3, max_points // len(codes))
+    keep = []
+    for code in codes:
+        idx = np.flatnonzero(rows.zip_codes == code)
+        keep.append(idx[lttb(rows.ts[idx] / S, rows.aqi[idx], budget)])
+    return rows.take(np.sort(np.concatenate(keep)))
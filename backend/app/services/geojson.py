@@ -1,13 +1,81 @@
-import json, os
+import gzip, hashlib, json, os, threading
+from app.utils import timing
+from app.utils.cache import file_version
+from app.utils.geometry import MAX_ZOOM, simplify_geometry
+
+try:
+    import brotli
+except ImportError:  # optional: br variants are skipped without it
+    brotli = None
 
 DATA_DIR = os.getenv("DATA_DIR", "./data")
-GJ = os.path.join(DATA_DIR, "raw", "zip_shapes.geojson")
+GJ = os.getenv("GEOJSON_PATH", os.path.join(DATA_DIR, "raw", "zip_shapes.geojson"))
+
+def data_version():
+    return file_version(GJ)
 
-def get_zip_geojson():
+def get_zip_geojson(zoom=None, quantize=False):
     with open(GJ) as f:
         gj = json.load(f)
-    # keep only the properties we care about
+    # keep only the properties we care about (the county file calls zip "Zip_Code")
     for feat in gj.get("features", []):
         props = feat.get("properties", {}) or {}
-        feat["properties"] = {"zip": props.get("zip"), "name": props.get("name")}
+        feat["properties"] = {"zip": props.get("zip", props.get("Zip_Code")), "name": props.get("name")}
+        if zoom is not None:
+            feat["geometry"] = simplify_geometry(feat.get("geometry"), zoom, quantize)
     return gj
+
+
+class EncodedGeoJSON:
+    """The trimmed GeoJSON pre-encoded once per file version, with compressed variants."""
+
+    def __init__(self, gj, version):
+        self.version = version
+        body = json.dumps(gj, separators=(",", ":")).encode()
+        tag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.variants = {"identity": body, "gzip": gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+        # strong ETags must differ per content-coding
+        self.etags = {enc: f'"{tag}"' if enc == "identity" else f'"{tag}-{enc}"' for enc in self.variants}
+
+    def negotiate(self, accept_encoding):
+        """Best available coding for an Accept-Encoding header value."""
+        q = {}
+        for part in (accept_encoding or "").split(","):
+            name, _, params = part.partition(";")
+            name, params = name.strip().lower(), params.replace(" ", "")
+            if name:
+                try:
+                    q[name] = float(params[2:]) if params.startswith("q=") else 1.0
+                except ValueError:
+                    q[name] = 0.0
+        best, best_q = "identity", 0.0
+        for enc in ("br", "gzip"):
+            w = q.get(enc, q.get("*", 0.0))
+            if enc in self.variants and w > best_q:
+                best, best_q = enc, w
+        return best
+
+
+_encoded = {}  # (zoom, quantize) -> EncodedGeoJSON
+_lock = threading.Lock()
+
+def get_encoded(zoom=None, quantize=False):
+    """Encoded variant for a zoom level (None = full resolution), built once per file version."""
+    if zoom is not None:
+        zoom = min(zoom, MAX_ZOOM)
+    else:
+        quantize = False
+    key, version = (zoom, quantize), data_version()
+    e = _encoded.get(key)
+    if e is not None and e.version == version:
+        return e
+    with _lock:
+        e = _encoded.get(key)
+        if e is None or e.version != version:
+            if any(v.version != version for v in _encoded.values()):
+                _encoded.clear()
+            with timing.load("geojson", "full" if zoom is None else f"zoom {zoom}"):
+                e = _encoded[key] = EncodedGeoJSON(get_zip_geojson(zoom, quantize), version)
+        return e
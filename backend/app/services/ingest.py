@@ -0,0 +1,290 @@
+"""Bulk ingest of readings into the memory backend.
+
+POST /api/v1/readings bodies (NDJSON or CSV) are parsed and validated a
+whole body at a time, with AQI computed from pm25 by app.utils.aqi. Valid
+readings wait in a buffer that is flushed once ``INGEST_BATCH_ROWS`` are
+pending or every ``INGEST_FLUSH_SECONDS``. A flush merges the batch into a
+new copy of the store and into its built rollup tables (re-combining only
+the rollup rows the batch touches, see app.services.rollups), appends the rows to
+processed/aqi_timeseries.csv, and swaps the new store in; readers keep
+using whichever store they already hold and never wait on the merge. With
+the shared snapshot on, a flush writes only its own rows for the other
+workers (app.services.timeseries.publish), so its cost follows the batch
+size rather than the store's.
+"""
+import logging, os, threading
+import numpy as np
+from app.services import live, timeseries
+from app.services.spatial import assign_zips
+from app.services.timeseries import CSV, Selection, get_store
+from app.utils import timing
+from app.utils.aqi import pm25_to_aqi
+
+BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", "200000"))
+FLUSH_SECONDS = float(os.getenv("INGEST_FLUSH_SECONDS", "1.0"))
+MAX_PENDING_ROWS = 10 * BATCH_ROWS  # past this, submitters flush inline instead of queueing more
+
+FORMATS = {"application/x-ndjson": "ndjson", "application/jsonl": "ndjson", "text/csv": "csv"}
+REQUIRED = ("timestamp", "sensor_id", "pm25")
+FIELDS = ("timestamp", "zip", "sensor_id", "lat", "lon", "pm25")
+
+log = logging.getLogger(__name__)
+
+
+def _read_table(body, fmt):
+    """The body's ``FIELDS`` as a DataFrame, zip and sensor_id as strings, the rest left for ``parse``
+    to coerce."""
+    import pyarrow as pa  # optional: only needed for ingest
+    if fmt == "csv":
+        import pyarrow.csv as pcsv
+        types = {"timestamp": pa.string(), "zip": pa.string(), "sensor_id": pa.string()}
+        table = pcsv.read_csv(pa.BufferReader(body), convert_options=pcsv.ConvertOptions(column_types=types))
+    else:
+        import pyarrow.json as pjson
+        try:
+            table = pjson.read_json(pa.BufferReader(body))
+        except pa.ArrowInvalid as e:
+            if "changed from" not in str(e):
+                raise
+            # a field whose JSON type varies between rows ("pm25": "n/a" among numbers): pyarrow
+            # infers one type per column and rejects the body, so read every field untyped instead
+            # and leave the bad values to the per-row checks
+            return _read_untyped(body)
+    cols = {c: table.column(c).cast(pa.string()) if c in ("zip", "sensor_id") else table.column(c)
+            for c in FIELDS if c in table.column_names}
+    return pa.table(cols).to_pandas()
+
+
+def _read_untyped(body):
+    import io
+    import pandas as pd
+    df = pd.read_json(io.BytesIO(body), lines=True, dtype=False, convert_dates=False, keep_default_dates=False)
+    df = df[[c for c in FIELDS if c in df.columns]]
+    for c in ("zip", "sensor_id"):
+        if c in df:
+            df[c] = df[c].astype("string")
+    return df
+
+
+def _timestamps(col):
+    """Naive-UTC datetime64[ns] array for a column of ISO 8601 values, NaT where a value doesn't parse.
+
+    Columns where every value has a UTC offset, or none does, are cast by
+    pyarrow; anything else (mixed, or with bad values) goes through pandas
+    value by value.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    try:
+        arr = pa.array(col, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):  # not all strings (NDJSON read untyped)
+        arr = None
+    for target in (pa.timestamp("ns", tz="UTC"), pa.timestamp("ns")) if arr is not None else ():
+        try:
+            ts = pc.cast(arr, target)
+        except pa.ArrowInvalid:
+            continue
+        return ts.cast(pa.timestamp("ns")).to_numpy(zero_copy_only=False)
+    ts = pd.to_datetime(col, utc=True, format="ISO8601", errors="coerce")
+    return ts.dt.tz_localize(None).to_numpy("datetime64[ns]")
+
+
+def parse(body, fmt):
+    """(valid readings as a DataFrame, number of rejected readings) for an NDJSON or CSV body.
+
+    Readings need a timestamp (ISO 8601; naive values are UTC), a sensor_id,
+    a finite non-negative pm25, and a zip or a lat/lon inside a known zip.
+    Malformed bodies and missing fields raise ValueError; rows failing the
+    checks are dropped and counted.
+    """
+    import pandas as pd
+    if not body.strip():
+        return pd.DataFrame(columns=[*FIELDS, "aqi"]), 0
+    try:
+        df = _read_table(body, fmt)
+    except ValueError as e:  # pyarrow.ArrowInvalid
+        raise ValueError(f"could not parse {fmt} body: {e}") from None
+    names = set(df.columns)
+    missing = [c for c in REQUIRED if c not in names]
+    if "zip" not in names and not {"lat", "lon"} <= names:
+        missing.append("zip (or lat and lon)")
+    if missing:
+        raise ValueError(f"readings are missing {', '.join(missing)}")
+
+    n = len(df)
+    ts = _timestamps(df["timestamp"])
+    pm25 = pd.to_numeric(df["pm25"], errors="coerce").to_numpy(np.float64)
+    sensor = df["sensor_id"].fillna("").to_numpy(dtype=str)
+    lat = pd.to_numeric(df["lat"], errors="coerce").to_numpy(np.float64) if "lat" in df else np.full(n, np.nan)
+    lon = pd.to_numeric(df["lon"], errors="coerce").to_numpy(np.float64) if "lon" in df else np.full(n, np.nan)
+    zips = df["zip"] if "zip" in df else None
+    if zips is None or (zips.isna().any() and np.isfinite(lat).any()):
+        zips = assign_zips(lon, lat, zips)
+    else:
+        zips = zips.fillna("").to_numpy(dtype=str)
+
+    ok = ~np.isnat(ts) & np.isfinite(pm25) & (pm25 >= 0) & (sensor != "") & (zips != "")
+    out = pd.DataFrame({
+        "timestamp": ts[ok].view(np.int64),
+        "zip": zips[ok], "sensor_id": sensor[ok], "lat": lat[ok], "lon": lon[ok], "pm25": pm25[ok],
+        "aqi": pm25_to_aqi(pm25[ok]),
+    })
+    return out, int(n - ok.sum())
+
+
+def _csv_bytes(df, header):
+    """``df`` as CSV rows (no header) in the given column order; unknown columns are left empty.
+
+    Fields are quoted only where needed (csv.QUOTE_MINIMAL), like the rows
+    the generators write. pyarrow writes the rows unquoted; the rare batch
+    with a value that needs quotes is written by pandas instead.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pcsv
+    ts = df["timestamp"].to_numpy()
+    unit = "s" if not (ts % 1_000_000_000).any() else "us"
+    cols = {"timestamp": np.datetime_as_string(ts.astype("datetime64[ns]"), unit=unit, timezone="UTC"),
+            "zip": df["zip"], "sensor_id": df["sensor_id"], "lat": df["lat"], "lon": df["lon"],
+            "pm25": df["pm25"], "aqi": df["aqi"].astype(np.int64),
+            "quality_flag": "ok", "source": "ingest"}
+    n = len(df)
+
+    def column(v):
+        if v is None:
+            return pa.nulls(n)
+        return pa.repeat(v, n) if isinstance(v, str) else pa.array(v, from_pandas=True)  # NaN -> empty
+    table = pa.table({f"c{i}": column(cols.get(c)) for i, c in enumerate(header)})
+    out = pa.BufferOutputStream()
+    try:
+        pcsv.write_csv(table, out, pcsv.WriteOptions(include_header=False, quoting_style="none"))
+    except pa.ArrowInvalid:  # a value holding a comma, quote or newline
+        import pandas as pd
+        frame = pd.DataFrame({c: cols.get(c) for c in header}, index=df.index)
+        return frame.to_csv(header=False, index=False, lineterminator="\n").encode()
+    return out.getvalue().to_pybytes()
+
+
+class Ingestor:
+    """Buffers parsed readings and appends them to the store in micro-batches.
+
+    A background thread flushes every ``flush_seconds``, or as soon as
+    ``batch_rows`` readings are pending. Flushes run one at a time; each
+    builds the next store from the current one off to the side and only
+    takes the store's lock for the CSV append and the swap.
+    """
+
+    def __init__(self, path=CSV, batch_rows=BATCH_ROWS, flush_seconds=FLUSH_SECONDS):
+        self.path, self.batch_rows, self.flush_seconds = path, batch_rows, flush_seconds
+        self._pending, self._rows = [], 0
+        self._lock = threading.Lock()        # guards the buffer
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+
+    def submit(self, frame):
+        """Queue parsed readings (a ``parse`` DataFrame)."""
+        if not len(frame):
+            return
+        with self._lock:
+            self._pending.append(frame)
+            self._rows += len(frame)
+            rows = self._rows
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ingest-flush", daemon=True)
+                self._thread.start()
+        if rows >= MAX_PENDING_ROWS:
+            self.flush()  # backpressure: writers outpacing the flusher pay for a flush themselves
+        elif rows >= self.batch_rows:
+            self._wake.set()
+
+    def pending(self):
+        return self._rows
+
+    def flush(self):
+        """Merge everything pending into the store now; returns the number of readings flushed."""
+        with self._flush_lock:
+            with self._lock:
+                frames, self._pending, self._rows = self._pending, [], 0
+            if not frames:
+                return 0
+            import pandas as pd
+            df = pd.concat(frames, ignore_index=True)
+            try:
+                with timing.phase("flush"):
+                    self._apply(df)
+            except Exception:
+                with self._lock:  # keep the readings for the next attempt
+                    self._pending[:0] = frames
+                    self._rows += len(df)
+                raise
+            return len(df)
+
+    def _apply(self, df):
+        sel = Selection.from_columns(df["timestamp"], df["zip"], df["sensor_id"], df["pm25"], df["aqi"])
+        while True:
+            base = get_store(self.path)
+            store, batch = base.append(sel)
+            if base.rollups is not None:
+                store.rollups = base.rollups.add(store, batch)
+            # only fails if the CSV was reloaded meanwhile; rebuild on top of the reloaded store
+            if timeseries.publish(base, store, lambda: self._write(df), self.path, batch):
+                break
+        try:
+            live.get_broker().publish_batch(store, batch)
+        except Exception:  # the readings are stored; a failed push must not re-queue them
+            log.exception("live update failed")
+
+    def _write(self, df):
+        with open(self.path, "rb+") as f:
+            header = f.readline().decode().strip().split(",")
+            f.seek(-1, os.SEEK_END)
+            newline = b"" if f.read(1) == b"\n" else b"\n"
+            f.write(newline + _csv_bytes(df, header))
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception("ingest flush failed; retrying on the next tick")
+
+    def close(self):
+        """Stop the flush thread and flush whatever is still pending."""
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+_ingestor = None
+_lock = threading.Lock()
+
+
+def get_ingestor():
+    global _ingestor
+    if _ingestor is None:
+        with _lock:
+            if _ingestor is None:
+                _ingestor = Ingestor()
+    return _ingestor
+
+
+def ingest(body, fmt, wait=False):
+    """Parse a request body and queue its readings; with ``wait``, flush before returning."""
+    with timing.phase("parse"):
+        frame, rejected = parse(body, fmt)
+    ingestor = get_ingestor()
+    ingestor.submit(frame)
+    if wait:
+        ingestor.flush()
+    return {"accepted": len(frame), "rejected": rejected, "pending": ingestor.pending()}
+
+
+def close():
+    if _ingestor is not None:
+        _ingestor.close()
@@ -0,0 +1,231 @@
+"""Live updates: new readings and per-zip hourly aggregates, pushed as ingest flushes them.
+
+Subscribers register for topics (``zip:<zip>``, ``sensor:<id>``, or
+``zip:*`` for every zip) and read from their own asyncio.Queue. Each
+flush's messages are encoded once, in the flushing thread; the event loop
+then puts the same Message object on every matching queue, so fan-out
+never copies or re-encodes per subscriber. A subscriber whose queue fills
+up is ended rather than allowed to hold the others back (EventSource
+clients reconnect on their own).
+
+Each worker process has its own broker. A flush is published by the worker
+that ran it, and by every other worker as it applies the flush's delta from
+the shared snapshot (app.services.timeseries); while a worker has
+subscribers it checks for new versions every ``LIVE_POLL_SECONDS``. With
+STORE_SNAPSHOT=0 workers share nothing, so live updates need a single
+worker.
+"""
+import asyncio, json, logging, os, threading, time
+import numpy as np
+from app.services import timeseries
+from app.utils.aqi import categories
+
+QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "256"))
+HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", "1"))
+HOUR = 3600 * 1_000_000_000
+
+log = logging.getLogger(__name__)
+
+
+class Message:
+    """One event, encoded once for every transport: ``data`` for WebSocket, ``sse`` for EventSource."""
+    __slots__ = ("event", "data", "sse")
+
+    def __init__(self, event, data):
+        self.event, self.data = event, data
+        self.sse = f"event: {event}\ndata: {data}\n\n".encode()
+
+
+class Subscription:
+    def __init__(self, topics, size=QUEUE_SIZE):
+        self.topics = topics
+        self.queue = asyncio.Queue(size)
+        self.ended = False
+
+    def offer(self, msg):
+        if self.ended:
+            return
+        try:
+            self.queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            self.end()
+
+    def end(self):
+        """Make the reader's next ``get`` return None; anything still queued is dropped."""
+        self.ended = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+def _groups(codes):
+    """(code, indices) per distinct value of ``codes``."""
+    order = np.argsort(codes, kind="stable")
+    uniq, starts = np.unique(codes[order], return_index=True)
+    return zip(uniq.tolist(), np.split(order, starts[1:]))
+
+
+class Broker:
+    """Topic -> subscriptions. Subscribing happens on the event loop; ``publish_batch``
+    may be called from any thread."""
+
+    def __init__(self, queue_size=QUEUE_SIZE, poll_seconds=POLL_SECONDS):
+        self.queue_size, self.poll_seconds = queue_size, poll_seconds
+        self._topics = {}
+        self._lock = threading.Lock()  # _topics is read by the flushing thread
+        self._loop = None
+        self._watcher = None
+
+    def subscribe(self, zips=(), sensors=()):
+        self._loop = asyncio.get_running_loop()
+        topics = [f"zip:{z}" for z in zips] + [f"sensor:{s}" for s in sensors] or ["zip:*"]
+        sub = Subscription(topics, self.queue_size)
+        with self._lock:
+            for t in topics:
+                self._topics.setdefault(t, set()).add(sub)
+            if self._watcher is None and timeseries.SHARED:
+                self._watcher = threading.Thread(target=self._watch, name="live-watch", daemon=True)
+                self._watcher.start()
+        return sub
+
+    def _watch(self):
+        # other workers' flushes only reach this one when it next reads the store (which then
+        # publishes them, see timeseries._open), so read it regularly while anyone listens
+        while True:
+            time.sleep(self.poll_seconds)
+            if not self._topics:
+                continue
+            try:
+                timeseries.get_store()
+            except Exception:
+                log.exception("live: checking for new readings failed")
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for t in sub.topics:
+                subs = self._topics.get(t)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._topics[t]
+
+    def _fanout(self, messages):
+        with self._lock:
+            topics = {t: list(subs) for t, subs in self._topics.items()}
+        for topic, msg in messages:
+            for sub in topics.get(topic, ()):
+                sub.offer(msg)
+            for sub in topics.get(topic.split(":", 1)[0] + ":*", ()):
+                sub.offer(msg)
+
+    def publish(self, messages):
+        """Hand (topic, Message) pairs to the event loop for delivery; safe from any thread."""
+        loop = self._loop
+        if not messages or loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._fanout, messages)
+        except RuntimeError:  # loop closed: nobody left to deliver to
+            pass
+
+    def publish_batch(self, store, batch):
+        """Encode and publish one ingest flush.
+
+        ``batch`` is the flushed Selection, coded against ``store`` (see
+        TimeseriesStore.append). A zip's message carries its new readings and
+        the count/mean/max AQI of every hour they touched, read back from
+        ``store`` so it covers earlier readings in the hour too. A sensor's
+        message carries just its readings. Topics nobody listens to are skipped.
+        """
+        with self._lock:
+            topics = set(self._topics)
+        if not topics:
+            return
+        all_zips = "zip:*" in topics
+        rows = [r for chunk in batch.json_rows() for r in chunk]
+        messages = []
+        for code, idx in _groups(batch.zip_codes):
+            zip = str(store.zips[code])
+            if not all_zips and f"zip:{zip}" not in topics:
+                continue
+            hours = self._hours(store, code, batch.ts[idx])
+            readings = ",".join([rows[i] for i in idx.tolist()])
+            messages.append((f"zip:{zip}", Message(
+                "zip", f'{{"zip":{json.dumps(zip)},"readings":[{readings}],"hours":{json.dumps(hours)}}}')))
+        if any(t.startswith("sensor:") for t in topics):
+            for code, idx in _groups(batch.sensor_codes):
+                sensor = str(store.sensors[code])
+                if f"sensor:{sensor}" not in topics:
+                    continue
+                readings = ",".join([rows[i] for i in idx.tolist()])
+                messages.append((f"sensor:{sensor}", Message(
+                    "sensor", f'{{"sensor_id":{json.dumps(sensor)},"readings":[{readings}]}}')))
+        self.publish(messages)
+
+    @staticmethod
+    def _hours(store, code, ts):
+        starts = np.unique(ts - ts % HOUR)
+        spans = [store._range(code, h, h + HOUR - 1) for h in starts.tolist()]
+        count = np.array([b - a for a, b in spans])
+        mean = np.array([store.aqi[a:b].mean(dtype=np.float64) for a, b in spans])
+        mx = [float(store.aqi[a:b].max()) for a, b in spans]
+        names, colors = categories(mean)
+        iso = np.datetime_as_string(starts.astype("datetime64[ns]"), unit="s", timezone="UTC")
+        return [{"start": s, "count": int(n), "mean": float(m), "max": x, "category": c, "color": k}
+                for s, n, m, x, c, k in zip(iso.tolist(), count.tolist(), mean.tolist(), mx,
+                                            names.tolist(), colors.tolist())]
+
+
+_broker = None
+_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _lock:
+            if _broker is None:
+                _broker = Broker()
+    return _broker
+
+
+async def sse(zips=(), sensors=()):
+    """text/event-stream body for a subscription, with a comment line as heartbeat."""
+    broker = get_broker()
+    sub = broker.subscribe(zips, sensors)
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                msg = await asyncio.wait_for(sub.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            if msg is None:
+                return
+            yield msg.sse
+    finally:
+        broker.unsubscribe(sub)
+
+
+async def pump(ws, zips=(), sensors=()):
+    """Forward a subscription's messages to an accepted WebSocket until either side ends it."""
+    broker = get_broker()
+    sub = broker.subscribe(zips, sensors)
+
+    async def watch():
+        # client messages are ignored; reading them is how a disconnect is noticed
+        while (await ws.receive())["type"] != "websocket.disconnect":
+            pass
+        sub.end()
+
+    watcher = asyncio.create_task(watch())
+    try:
+        while (msg := await sub.queue.get()) is not None:
+            await ws.send_text(msg.data)
+        if not watcher.done():  # dropped for falling behind, not disconnected
+            await ws.close(code=1013)
+    finally:
+        watcher.cancel()
+        broker.unsubscribe(sub)
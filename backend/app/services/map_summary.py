@@ -0,0 +1,21 @@
+from app.services.storage import get_backend
+from app.utils import timing
+from app.utils.aqi import categories
+
+META = {"source": "synthetic"}
+
+def get_map_summary(start, end):
+    """One row per zip for a choropleth: AQI stats, category/color of the mean, and sensor count.
+
+    Rows carry ``zip`` so they join client-side against /geojson features.
+    """
+    backend = get_backend()
+    stats, sensors = backend.zip_stats(start, end), backend.sensor_counts()
+    zips = sorted(set(stats) | set(sensors))
+    means = [stats[z]["mean"] if z in stats else float("nan") for z in zips]
+    names, colors = categories(means)
+    empty = {"mean": None, "p95": None, "max": None, "count": 0}
+    rows = [{"zip": z, **stats.get(z, empty), "category": n, "color": c, "sensors": sensors.get(z, 0)}
+            for z, n, c in zip(zips, names.tolist(), colors.tolist())]
+    timing.rows(returned=len(rows))
+    return {"zips": rows, "meta": META}
@@ -0,0 +1,468 @@
+"""Hourly/daily/monthly rollups of the timeseries per sensor and per zip.
+
+Each rollup row holds count, sum, min and max of pm25 and aqi for one
+(entity, bucket), plus a sparse quantile sketch per measure
+(app.utils.sketch). Rows are sorted by (entity, bucket start) with a
+per-entity offsets table, like the store itself, so any bucket-aligned
+window is a contiguous row range. Sensor rows are further split by the
+zip the readings were taken in, so a sensor's rows can be filtered and
+labelled by zip like the zip tables'.
+
+Built tables are saved with the store snapshot (TimeseriesStore.save) and
+memory-mapped back with it, so a worker starting on a published snapshot
+doesn't rebuild them; PREBUILT are built before a snapshot is first saved.
+"""
+import os, threading
+import numpy as np
+from app.utils import sketch, timing
+from app.services.downsample import BUCKETS, WEEK_ORIGIN, Buckets, bucketize
+from app.services.timeseries import get_store, to_ns
+
+H, D = 3600 * 1_000_000_000, 86400 * 1_000_000_000
+LEVELS = ("hour", "day", "month")
+KINDS = ("zip", "sensor")
+MEASURES = ("pm25", "aqi")
+PREBUILT = tuple((kind, level) for kind in KINDS for level in LEVELS)  # what the window/bucket queries read
+RECENT_FRACTION = 8  # see Rollups
+SKETCH = ("offsets", "bins", "counts")
+
+
+def floor_ts(ts, level):
+    if level == "hour":
+        return ts - ts % H
+    if level == "day":
+        return ts - ts % D
+    return ts.astype("datetime64[ns]").astype("datetime64[M]").astype("datetime64[ns]").view(np.int64)
+
+
+def bucket_end(start, level):
+    if level == "hour":
+        return start + H
+    if level == "day":
+        return start + D
+    return int((np.datetime64(start, "ns").astype("datetime64[M]") + 1).astype("datetime64[ns]").view(np.int64))
+
+
+def _decompose(lo, hi, levels=("month", "day", "hour")):
+    """Split [lo, hi) into whole buckets of the coarsest level that fits and
+    ("raw", a, b) pieces left over at the edges."""
+    if lo >= hi:
+        return []
+    if not levels:
+        return [("raw", lo, hi)]
+    level = levels[0]
+    f = int(floor_ts(np.array([lo]), level)[0])
+    a = lo if f == lo else bucket_end(f, level)
+    b = int(floor_ts(np.array([hi]), level)[0])
+    if a >= b:
+        return _decompose(lo, hi, levels[1:])
+    return _decompose(lo, a, levels[1:]) + [(level, a, b)] + _decompose(b, hi, levels[1:])
+
+
+def _ranges(starts, ends):
+    """Concatenated aranges [starts[i], ends[i])."""
+    lens = ends - starts
+    return np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens) + np.repeat(starts, lens)
+
+
+def _new_group(*cols):
+    """True where any of the (sorted) columns changes value, i.e. at each group start."""
+    flag = np.ones(len(cols[0]), bool)
+    for c in cols:
+        flag[1:] &= c[1:] == c[:-1]
+    flag[1:] = ~flag[1:]
+    return flag
+
+
+def _reduceat(ufunc, v, starts):
+    return ufunc.reduceat(v, starts) if len(starts) else v[:0]
+
+
+def _splice(kind, level, n_entities, runs):
+    """Table of the row runs ``(table, a, b)`` concatenated in order."""
+    runs = [(t, int(a), int(b)) for t, a, b in runs if b > a] or runs[:1]
+
+    def cat(col):
+        return np.concatenate([col(t)[a:b] for t, a, b in runs])
+    stats = {m: {k: cat(lambda t: t.stats[m][k]) for k in ("sum", "min", "max")} for m in MEASURES}
+    sketches = {}
+    for m in MEASURES:
+        offs, bins, counts, pos = [], [], [], 0
+        for t, a, b in runs:
+            off, tb, tc = t.sketches[m]
+            lo, hi = int(off[a]), int(off[b])
+            offs.append(off[a:b] + (pos - lo))
+            bins.append(tb[lo:hi])
+            counts.append(tc[lo:hi])
+            pos += hi - lo
+        offs.append([pos])
+        sketches[m] = (np.concatenate(offs).astype(np.int64), np.concatenate(bins), np.concatenate(counts))
+    zc = None if kind == "zip" else cat(lambda t: t.zip)
+    return Rollup(kind, level, n_entities, cat(lambda t: t.entity), cat(lambda t: t.start), zc,
+                  cat(lambda t: t.count), stats, sketches)
+
+
+class Rollup:
+    """One (kind, level) rollup table.
+
+    ``zip`` is the zip code of each row: the entity itself for zip tables,
+    where rows are keyed by (entity, bucket), and a third key for sensor
+    tables, keyed by (entity, bucket, zip).
+    """
+
+    def __init__(self, kind, level, n_entities, entity, start, zip, count, stats, sketches, offsets=None):
+        self.kind, self.level, self.n_entities = kind, level, n_entities
+        self.entity, self.start, self.count = entity, start, count
+        self.zip = entity if kind == "zip" else zip
+        self.stats = stats        # measure -> {"sum", "min", "max"} arrays, one value per row
+        self.sketches = sketches  # measure -> (offsets, bins, counts); row i owns offsets[i]:offsets[i + 1]
+        self.offsets = np.searchsorted(entity, np.arange(n_entities + 1)) if offsets is None else offsets
+
+    def __len__(self):
+        return len(self.entity)
+
+    def save(self, directory):
+        """Write the table's arrays as .npy files for ``load``."""
+        os.makedirs(directory)
+        arrays = {"entity": self.entity, "start": self.start, "count": self.count, "offsets": self.offsets}
+        if self.kind != "zip":
+            arrays["zip"] = self.zip
+        for m in MEASURES:
+            arrays.update({f"{m}.{k}": v for k, v in self.stats[m].items()})
+            arrays.update({f"{m}.sketch_{k}": v for k, v in zip(SKETCH, self.sketches[m])})
+        for name, a in arrays.items():
+            np.save(os.path.join(directory, name + ".npy"), a)
+
+    @classmethod
+    def load(cls, directory, kind, level):
+        """Table over files written by ``save``, memory-mapped read-only."""
+        def col(name):
+            return np.asarray(np.load(os.path.join(directory, name + ".npy"), mmap_mode="r"))
+        offsets = col("offsets")
+        stats = {m: {k: col(f"{m}.{k}") for k in ("sum", "min", "max")} for m in MEASURES}
+        sketches = {m: tuple(col(f"{m}.sketch_{k}") for k in SKETCH) for m in MEASURES}
+        zip = None if kind == "zip" else col("zip")
+        return cls(kind, level, len(offsets) - 1, col("entity"), col("start"), zip, col("count"), stats, sketches,
+                   offsets)
+
+    @classmethod
+    def build(cls, kind, level, rows):
+        """Roll up raw readings: a store or a Selection coded like one."""
+        entity, n = (rows.zip_codes, len(rows.zips)) if kind == "zip" else (rows.sensor_codes, len(rows.sensors))
+        start = floor_ts(rows.ts, level)
+        keys = (start, entity) if kind == "zip" else (rows.zip_codes, start, entity)
+        order = np.lexsort(keys)
+        keys = [k[order] for k in reversed(keys)]
+        starts = np.flatnonzero(_new_group(*keys))
+        count = np.diff(np.r_[starts, len(order)])
+        row = np.repeat(np.arange(len(starts)), count)
+        stats, sketches = {}, {}
+        for m in MEASURES:
+            v = getattr(rows, m)[order]
+            stats[m] = {"sum": _reduceat(np.add, v.astype(np.float64), starts),
+                        "min": _reduceat(np.minimum, v, starts),
+                        "max": _reduceat(np.maximum, v, starts)}
+            g, b, c = sketch.group_sketch(row, v)
+            sketches[m] = (np.searchsorted(g, np.arange(len(starts) + 1)), b, c)
+        zip = None if kind == "zip" else keys[2][starts]
+        return cls(kind, level, n, keys[0][starts], keys[1][starts], zip, count, stats, sketches)
+
+    def take(self, rows):
+        """Table of just ``rows`` (increasing row indices)."""
+        stats = {m: {k: v[rows] for k, v in self.stats[m].items()} for m in MEASURES}
+        sketches = {}
+        for m in MEASURES:
+            off, b, c = self.sketches[m]
+            lens = off[rows + 1] - off[rows]
+            e = _ranges(off[rows], off[rows + 1])
+            sketches[m] = (np.r_[0, np.cumsum(lens)], b[e], c[e])
+        zip = None if self.kind == "zip" else self.zip[rows]
+        return Rollup(self.kind, self.level, self.n_entities, self.entity[rows], self.start[rows], zip,
+                      self.count[rows], stats, sketches)
+
+    def merge(self, other):
+        """New rollup with ``other``'s rows folded in (rows for the same bucket are combined).
+
+        Only each entity's rows from ``other``'s first bucket for it onwards
+        are combined; everything else is copied over in runs, so folding in
+        a batch of recent readings costs a copy of this table plus work in
+        proportion to the batch rather than a re-sort of the whole table.
+        """
+        touched = np.flatnonzero(np.diff(other.offsets))
+        old = touched[touched < self.n_entities]
+        cut = np.array([self.offsets[e] + np.searchsorted(self.start[self.offsets[e]:self.offsets[e + 1]],
+                                                          other.start[other.offsets[e]]) for e in old], np.int64)
+        end = np.asarray(self.offsets[old + 1], np.int64)
+        tail = self.take(_ranges(cut, end))._combine(other)
+        # self's untouched runs, each followed by the next touched entity's combined rows; entities
+        # new to self come last, after the final run
+        runs, prev = [], 0
+        for e, a, b in zip(old.tolist(), cut.tolist(), end.tolist()):
+            runs += [(self, prev, a), (tail, tail.offsets[e], tail.offsets[e + 1])]
+            prev = b
+        runs += [(self, prev, len(self)), (tail, tail.offsets[self.n_entities], len(tail))]
+        return _splice(self.kind, self.level, max(self.n_entities, other.n_entities), runs)
+
+    @staticmethod
+    def concat(tables):
+        """The tables' rows one after the other (not re-sorted, and not combined per bucket)."""
+        return _splice(tables[0].kind, tables[0].level, max(t.n_entities for t in tables),
+                       [(t, 0, len(t)) for t in tables])
+
+    def _combine(self, other):
+        """``merge`` by a sort over both tables' rows."""
+        n = max(self.n_entities, other.n_entities)
+        entity = np.r_[self.entity, other.entity]
+        start = np.r_[self.start, other.start]
+        zip = np.r_[self.zip, other.zip]
+        order = np.lexsort((start, entity) if self.kind == "zip" else (zip, start, entity))
+        flag = _new_group(entity[order], start[order], zip[order])
+        starts = np.flatnonzero(flag)
+        new_row = np.empty(len(order), np.int64)
+        new_row[order] = np.cumsum(flag) - 1
+        count = _reduceat(np.add, np.r_[self.count, other.count][order], starts)
+        stats, sketches = {}, {}
+        for m in MEASURES:
+            cat = {k: np.r_[self.stats[m][k], other.stats[m][k]][order] for k in ("sum", "min", "max")}
+            stats[m] = {"sum": _reduceat(np.add, cat["sum"], starts),
+                        "min": _reduceat(np.minimum, cat["min"], starts),
+                        "max": _reduceat(np.maximum, cat["max"], starts)}
+            (oa, ba, ca), (ob, bb, cb) = self.sketches[m], other.sketches[m]
+            # both sides map onto increasing result rows, so their triples merge without a sort
+            ga = np.repeat(new_row[:len(self)], np.diff(oa))
+            gb = np.repeat(new_row[len(self):], np.diff(ob))
+            g, b, c = sketch.merge_sorted((ga, ba, ca), (gb, bb, cb))
+            sketches[m] = (np.searchsorted(g, np.arange(len(starts) + 1)), b, c)
+        return Rollup(self.kind, self.level, n, entity[order][starts], start[order][starts], zip[order][starts],
+                      count, stats, sketches)
+
+    def span(self, code, lo_ns, hi_ns):
+        """Row range [a, b) for entity ``code`` with lo_ns <= bucket start < hi_ns."""
+        if code >= self.n_entities:  # an entity new since this table was built
+            return len(self), len(self)
+        s, e = self.offsets[code], self.offsets[code + 1]
+        block = self.start[s:e]
+        return s + np.searchsorted(block, lo_ns), s + np.searchsorted(block, hi_ns)
+
+    def rows(self, codes, lo_ns, hi_ns):
+        """Row indices for entities ``codes`` with lo_ns <= bucket start < hi_ns."""
+        spans = np.array([self.span(code, lo_ns, hi_ns) for code in codes], np.int64).reshape(-1, 2)
+        return _ranges(spans[:, 0], spans[:, 1])
+
+    def aggregate(self, idx, group, measure, agg):
+        """``agg`` of ``measure`` over rows ``idx`` labelled with sorted group ids ``group``."""
+        starts = np.flatnonzero(_new_group(group))
+        st = self.stats[measure]
+        if agg == "mean":
+            return _reduceat(np.add, st["sum"][idx], starts) / _reduceat(np.add, self.count[idx], starts)
+        if agg == "max":
+            return _reduceat(np.maximum, st["max"][idx], starts)
+        off, b, c = self.sketches[measure]
+        t = _ranges(off[idx], off[idx + 1])
+        g, b, c = sketch.merge(np.repeat(group, off[idx + 1] - off[idx]), b[t], c[t])
+        return sketch.group_quantile(g, b, c, 0.95)[1]
+
+
+class Rollups:
+    """All rollup tables for one store version; tables are built on first use.
+
+    Each table is held as its main part plus, after ``add``, a small part
+    with the rows added since the main part was last merged. Queries read
+    both (every statistic here is additive), and the recent part is merged
+    into the main one once it passes 1/RECENT_FRACTION of its size, so a
+    flush copies the large table only every so many flushes.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.zips = store.zips
+        self._tables = {}  # (kind, level) -> [main] or [main, recent]
+        self._lock = threading.Lock()
+
+    def parts(self, kind, level):
+        p = self._tables.get((kind, level))
+        if p is None:
+            with self._lock:
+                p = self._tables.get((kind, level))
+                if p is None:
+                    with timing.load("rollups", f"{kind}/{level}"):
+                        p = [Rollup.build(kind, level, self.store)]
+                    self._tables[(kind, level)] = p
+        return p
+
+    def table(self, kind, level):
+        """The (kind, level) table as one Rollup."""
+        main, *recent = self.parts(kind, level)
+        return main.merge(recent[0]) if recent else main
+
+    def prebuild(self, tables=PREBUILT):
+        for kind, level in tables:
+            self.parts(kind, level)
+        return self
+
+    def save(self, directory):
+        """Write every table built so far under ``directory`` (one subdirectory per table)."""
+        with self._lock:
+            tables = list(self._tables)
+        for kind, level in tables:
+            self.table(kind, level).save(os.path.join(directory, f"{kind}-{level}"))
+
+    @classmethod
+    def load(cls, store, directory):
+        """Rollups for ``store`` with the tables saved under ``directory`` mapped in; others build lazily."""
+        out = cls(store)
+        for name in os.listdir(directory):
+            kind, level = name.split("-")
+            if kind in KINDS and level in LEVELS:
+                out._tables[(kind, level)] = [Rollup.load(os.path.join(directory, name), kind, level)]
+        return out
+
+    def add(self, store, batch):
+        """Rollups for ``store``: these plus ``batch``, as returned by ``self.store.append``.
+
+        Only tables built so far are carried over: the batch's own rollup is
+        merged into each table's recent part, and that into the main part
+        once it is big enough. The rest build lazily from ``store`` as usual.
+        """
+        out = Rollups(store)
+        with self._lock:
+            tables = list(self._tables.items())
+        for (kind, level), (main, *recent) in tables:
+            rows = Rollup.build(kind, level, batch)
+            rows = recent[0].merge(rows) if recent else rows
+            out._tables[(kind, level)] = ([main.merge(rows)] if len(rows) * RECENT_FRACTION > len(main)
+                                          else [main, rows])
+        return out
+
+    def _zip_codes(self, zips):
+        if zips is None:
+            return list(range(len(self.store.zips)))
+        return [self.store.zip_index[z] for z in zips if z in self.store.zip_index]
+
+    def _rows(self, level, a, b, codes, sensor):
+        """[(table part, zip code, row indices)] for buckets starting in [a, b): per zip from the zip
+        table, or ``sensor``'s rows from the sensor table split by the zip they were read in."""
+        out = []
+        if sensor is None:
+            for t in self.parts("zip", level):
+                out += [(t, code, np.arange(*t.span(code, a, b))) for code in codes]
+            return out
+        wanted = set(codes)
+        for t in self.parts("sensor", level):
+            r0, r1 = t.span(sensor, a, b)
+            rows, zc = np.arange(r0, r1), t.zip[r0:r1]
+            out += [(t, code, rows[zc == code]) for code in np.unique(zc).tolist() if code in wanted]
+        return out
+
+    def window(self, start, end, zips=None, sensor=None):
+        """Per-zip AQI count, sum, max and dense sketch over [start, end], optionally for one sensor.
+
+        Whole months, days and hours are merged from the rollups and only the
+        readings in the partial hours at either edge are touched, so the cost
+        depends on the window's shape rather than on how many readings it holds.
+        Returns ``{zip code: (count, sum, max, hist)}`` for zips with readings.
+        """
+        codes = self._zip_codes(zips)
+        if sensor is not None:
+            sensor = self.store.sensor_index.get(sensor)
+            if sensor is None:
+                return {}
+        n = len(self.store.zips)
+        count, total = np.zeros(n, np.int64), np.zeros(n)
+        mx, hist = np.full(n, -np.inf), np.zeros((n, sketch.NBINS))
+        scanned = 0
+        for level, a, b in _decompose(to_ns(start), to_ns(end) + 1):
+            if level == "raw":
+                for code in codes:
+                    r0, r1 = self.store._range(code, a, b - 1)
+                    scanned += r1 - r0
+                    aqi = self.store.aqi[r0:r1]
+                    if sensor is not None:
+                        aqi = aqi[self.store.sensor_codes[r0:r1] == sensor]
+                    count[code] += len(aqi)
+                    total[code] += aqi.sum(dtype=np.float64)
+                    mx[code] = max(mx[code], aqi.max(initial=-np.inf))
+                    hist[code] += np.bincount(sketch.bins(aqi), minlength=sketch.NBINS)
+                continue
+            for t, code, idx in self._rows(level, a, b, codes, sensor):
+                if not len(idx):
+                    continue
+                off, sb, sc = t.sketches["aqi"]
+                scanned += len(idx)
+                count[code] += t.count[idx].sum()
+                total[code] += t.stats["aqi"]["sum"][idx].sum()
+                mx[code] = max(mx[code], t.stats["aqi"]["max"][idx].max())
+                e = _ranges(off[idx], off[idx + 1])
+                hist[code] += sketch.dense(sb[e], sc[e])
+        timing.rows(scanned=scanned)
+        return {code: (int(count[code]), total[code], float(mx[code]), hist[code]) for code in codes if count[code]}
+
+    def stats(self, start, end, zips=None, sensor=None):
+        """mean/p95/max AQI over [start, end] and the given zips (all when None), optionally
+        for one sensor; p95 comes from the merged sketches."""
+        parts = list(self.window(start, end, zips, sensor).values())
+        if not parts:
+            return {"mean": None, "p95": None, "max": None}
+        n = sum(p[0] for p in parts)
+        return {"mean": float(sum(p[1] for p in parts) / n),
+                "p95": sketch.quantile(sum(p[3] for p in parts), 0.95),
+                "max": max(p[2] for p in parts)}
+
+    def buckets(self, start, end, zip, bucket, agg, sensor=None):
+        """Bucketed per-zip rows for [start, end], optionally for one sensor: whole buckets
+        come from the rollups, partial buckets at either edge are computed from raw readings."""
+        width = BUCKETS[bucket]
+        origin = WEEK_ORIGIN if bucket == "1w" else 0
+        lo, hi = to_ns(start), to_ns(end)
+        full_lo = -((origin - lo) // width) * width + origin  # first bucket start >= lo
+        full_hi = (hi + 1 - origin) // width * width + origin  # end of the last bucket ending <= hi
+        if full_lo >= full_hi:
+            return bucketize(self.store.select(start, end, zip, sensor), bucket, agg)
+
+        level = "hour" if bucket == "1h" else "day"
+        codes = [self.store.zip_index[zip]] if zip in self.store.zip_index else [] if zip else range(len(self.zips))
+        if sensor is None:
+            picked = [(t, t.rows(codes, full_lo, full_hi)) for t in self.parts("zip", level)]
+        else:
+            scode = self.store.sensor_index.get(sensor)
+            picked = [(t, t.rows([] if scode is None else [scode], full_lo, full_hi))
+                      for t in self.parts("sensor", level)]
+            if zip:
+                picked = [(t, idx[np.isin(t.zip[idx], codes)]) for t, idx in picked]
+        if len(picked) == 1:
+            t, idx = picked[0]
+        else:  # rows of both parts in one table; rows for the same bucket are grouped below
+            t = Rollup.concat([t.take(idx) for t, idx in picked])
+            idx = np.arange(len(t))
+        timing.rows(scanned=len(idx))
+        bstart = (t.start[idx] - origin) // width * width + origin
+        if sensor is not None or len(picked) > 1:  # not in (zip, bucket) order; group them per zip
+            order = np.lexsort((bstart, t.zip[idx]))
+            idx, bstart = idx[order], bstart[order]
+        zc = t.zip[idx]
+        flag = _new_group(zc, bstart)
+        group, starts = np.cumsum(flag) - 1, np.flatnonzero(flag)
+        parts = [Buckets(bstart[starts], zc[starts], self.zips,
+                         t.aggregate(idx, group, "pm25", agg), t.aggregate(idx, group, "aqi", agg),
+                         _reduceat(np.add, t.count[idx], starts))]
+        if lo < full_lo:
+            parts.append(bucketize(self.store.select(lo, full_lo - 1, zip, sensor), bucket, agg))
+        if full_hi <= hi:
+            parts.append(bucketize(self.store.select(full_hi, hi, zip, sensor), bucket, agg))
+        out = Buckets.concat(parts)
+        return out.take(np.lexsort((out.zip_codes, out.ts)))
+
+
+_lock = threading.Lock()
+
+
+def get_rollups():
+    """Rollups for the current store; built once per store and kept on it."""
+    store = get_store()
+    r = store.rollups
+    if r is None:
+        with _lock:
+            if store.rollups is None:
+                store.rollups = Rollups(store)
+            r = store.rollups
+    return r
@@ -1,9 +1,8 @@
-import os, pandas as pd
+from app.services.storage import get_backend
 
-DATA_DIR = os.getenv("DATA_DIR", "./data")
-SENS = os.path.join(DATA_DIR, "raw", "sensors_seed.csv")
-
-def get_counts(zip):
-    df = pd.read_csv(SENS)
-    n = int((df["zip"] == zip).sum())
-    return {"zip": zip, "sensors": n}
+def get_counts(zips=None):
+    """{"zip", "sensors"} for a single zip, else {"counts": {zip: n}} for several (or every) zip."""
+    registry = get_backend().sensors()
+    if zips and len(zips) == 1:
+        return {"zip": zips[0], "sensors": registry.count(zips[0])}
+    return {"counts": registry.counts(zips or None)}
@@ -0,0 +1,139 @@
+"""Sensor registry: metadata from raw/sensors_seed.csv (or the DuckDB
+readings table) loaded once per file version, with dict indexes by zip,
+model and install date and a point grid for viewport queries. The memory
+backend adds sensors only known from their readings (see ``with_readings``)."""
+import os, threading
+import numpy as np
+from app.services import geojson
+from app.services.spatial import assign_zips
+from app.utils.cache import file_version
+from app.utils import timing
+from app.utils.spatial import Grid
+
+DATA_DIR = os.getenv("DATA_DIR", "./data")
+SENS = os.path.join(DATA_DIR, "raw", "sensors_seed.csv")
+
+FIELDS = ["sensor_id", "zip", "lat", "lon", "install_date", "model"]
+
+
+def _index(col):
+    """value -> row indices, for a column of strings (missing values are skipped)."""
+    return {k: np.asarray(v, np.int64) for k, v in col.dropna().groupby(col.dropna()).indices.items()}
+
+
+class SensorRegistry:
+    def __init__(self, df, version):
+        self.version = version
+        self.df = df.drop_duplicates("sensor_id").reset_index(drop=True)
+        self.by_zip = _index(self.df["zip"])
+        self.by_model = _index(self.df["model"]) if "model" in self.df else {}
+        self.by_install_date = _index(self.df["install_date"]) if "install_date" in self.df else {}
+        self._counts = {z: len(idx) for z, idx in self.by_zip.items()}
+        lon, lat = self.df["lon"].to_numpy(np.float64), self.df["lat"].to_numpy(np.float64)
+        # sensors without coordinates can't be placed in a viewport, and NaN would break the grid
+        self._located = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+        self.grid = Grid(np.c_[lon, lat, lon, lat][self._located])
+        self._extended = None  # (store sensors array, registry) from the last with_readings
+
+    @classmethod
+    def from_frame(cls, df, version=None):
+        if "zip" not in df:
+            df["zip"] = None
+        # sensors without a zip are placed by the polygon they sit in
+        df["zip"] = assign_zips(df["lon"], df["lat"], df["zip"])
+        return cls(df[[c for c in FIELDS if c in df]], version)
+
+    @classmethod
+    def from_csv(cls, path, version=None):
+        import pandas as pd
+        return cls.from_frame(pd.read_csv(path, dtype={"zip": str, "sensor_id": str, "install_date": str,
+                                                       "model": str}), version)
+
+    @classmethod
+    def empty(cls, version=None):
+        import pandas as pd
+        return cls(pd.DataFrame({c: pd.Series(dtype=float if c in ("lat", "lon") else object) for c in FIELDS}),
+                   version)
+
+    @classmethod
+    def from_duckdb(cls, conn, version=None):
+        df = conn.execute("SELECT DISTINCT Sensor_ID AS sensor_id, Zip_Code AS zip, Latitude AS lat, "
+                          "Longitude AS lon FROM air_quality ORDER BY sensor_id").df()
+        return cls.from_frame(df, version)
+
+    def __len__(self):
+        return len(self.df)
+
+    def with_readings(self, store):
+        """This registry plus the sensors in ``store`` it doesn't list (e.g. first seen by ingest),
+        each in the zip of its latest reading and without coordinates or metadata.
+
+        The result is kept until the store's sensor categories change, which
+        ``append`` only does when a batch brings new sensors.
+        """
+        cached = self._extended
+        if cached is not None and cached[0] is store.sensors:
+            return cached[1]
+        codes = np.flatnonzero(~np.isin(store.sensors, self.df["sensor_id"].to_numpy(dtype=str)))
+        registry = self
+        if len(codes):
+            import pandas as pd
+            rows = np.flatnonzero(np.isin(store.sensor_codes, codes))
+            rows = rows[np.lexsort((store.ts[rows], store.sensor_codes[rows]))]
+            sc = store.sensor_codes[rows]
+            last = rows[np.r_[sc[1:] != sc[:-1], True]] if len(rows) else rows
+            extra = pd.DataFrame({"sensor_id": store.sensors[store.sensor_codes[last]].astype(object),
+                                  "zip": store.zips[store.zip_codes[last]].astype(object)})
+            registry = SensorRegistry(pd.concat([self.df, extra], ignore_index=True), self.version)
+        self._extended = (store.sensors, registry)
+        return registry
+
+    def records(self, idx=None):
+        df = self.df if idx is None else self.df.iloc[np.sort(idx)]
+        return df.astype(object).where(df.notna(), None).to_dict("records")
+
+    def count(self, zip):
+        return self._counts.get(zip, 0)
+
+    def counts(self, zips=None):
+        """Sensors per zip, for the given zips (every zip when None)."""
+        if zips is None:
+            return dict(self._counts)
+        return {z: self._counts.get(z, 0) for z in zips}
+
+    def query(self, zip=None, model=None, install_date=None, bbox=None):
+        """Records matching every given filter; ``bbox`` is (minx, miny, maxx, maxy)."""
+        idx = None
+        for index, key in ((self.by_zip, zip), (self.by_model, model), (self.by_install_date, install_date)):
+            if key is not None:
+                rows = index.get(key, np.empty(0, np.int64))
+                idx = rows if idx is None else np.intersect1d(idx, rows)
+        if bbox is not None:
+            rows = self._located[self.grid.query(*bbox)]
+            idx = rows if idx is None else np.intersect1d(idx, rows)
+        return self.records(idx)
+
+
+_registry = None
+_lock = threading.Lock()
+
+def data_version():
+    # zips may come from the polygons, so the table depends on both files
+    return file_version(SENS) + geojson.data_version()
+
+def get_sensors():
+    """Process-wide registry from the seed CSV, reloaded when it (or the zip polygons) change;
+    empty without one."""
+    global _registry
+    version = data_version()
+    registry = _registry
+    if registry is not None and registry.version == version:
+        return registry
+    with _lock:
+        if _registry is None or _registry.version != version:
+            if not os.path.exists(SENS):
+                _registry = SensorRegistry.empty(version)
+            else:
+                with timing.load("sensors", "csv"):
+                    _registry = SensorRegistry.from_csv(SENS, version)
+        return _registry
@@ -0,0 +1,51 @@
+"""Zip polygon index for point-in-polygon zip assignment, rebuilt when the GeoJSON changes."""
+import threading
+import numpy as np
+from app.services import geojson
+from app.utils import timing
+from app.utils.spatial import PolygonIndex
+
+
+class ZipIndex:
+    def __init__(self, gj, version):
+        self.version = version
+        feats = gj.get("features", [])
+        self.zips = np.array([str(f["properties"].get("zip") or "") for f in feats], dtype=str)
+        self.polygons = PolygonIndex([f.get("geometry") for f in feats])
+
+    def assign(self, lon, lat):
+        """Zip containing each (lon, lat), or "" where no polygon does."""
+        hit = self.polygons.locate(lon, lat)
+        return np.where(hit >= 0, np.r_[self.zips, [""]][hit], "")
+
+    def query(self, minx, miny, maxx, maxy):
+        """Zips whose polygon bounding box intersects the given box."""
+        return self.zips[self.polygons.query(minx, miny, maxx, maxy)].tolist()
+
+
+_index = None
+_lock = threading.Lock()
+
+def get_zip_index():
+    global _index
+    version = geojson.data_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        if _index is None or _index.version != version:
+            with timing.load("zip_index", "geojson"):
+                _index = ZipIndex(geojson.get_zip_geojson(), version)
+        return _index
+
+def assign_zips(lon, lat, zips=None):
+    """Fill missing (empty/NaN) entries of ``zips`` from the polygon containing each point."""
+    lon, lat = np.asarray(lon, np.float64), np.asarray(lat, np.float64)
+    if zips is None:
+        return get_zip_index().assign(lon, lat)
+    import pandas as pd  # deferred, like every pandas import in the services: it costs ~0.3s at startup
+    out = pd.Series(zips, dtype=object).fillna("").to_numpy(dtype=str)
+    ok = (out == "") & np.isfinite(lon) & np.isfinite(lat)
+    if ok.any():
+        out[ok] = get_zip_index().assign(lon[ok], lat[ok])
+    return out
@@ -0,0 +1,252 @@
+"""Pluggable storage backends for the AQI services.
+
+``STORAGE_BACKEND=memory`` (default) answers from the in-process columnar
+store built from processed/aqi_timeseries.csv; ``STORAGE_BACKEND=duckdb``
+pushes filters and aggregates down into the ``air_quality`` table written
+by data_generation/generate_air_quality_data.py; ``STORAGE_BACKEND=parquet``
+runs the same SQL over that script's hive-partitioned output
+(``--format hive``, zip=/year=/month=), skipping partitions outside the
+query's zip and months and row groups outside its time range.
+"""
+import os, queue, threading, time
+from contextlib import contextmanager, nullcontext
+import numpy as np
+from app.services.downsample import Buckets, bucketize
+from app.services.rollups import get_rollups
+from app.services.sensors import SensorRegistry, get_sensors
+from app.services.sensors import data_version as sensors_version
+from app.services.timeseries import CSV, Selection, get_store, snapshot, to_ns
+from app.utils import sketch, timing
+from app.utils.cache import file_version, tree_version
+
+DATA_DIR = os.getenv("DATA_DIR", "./data")
+DUCKDB_PATH = os.getenv("DUCKDB_PATH", os.path.join(DATA_DIR, "dummy_air_quality.duckdb"))
+DUCKDB_POOL_SIZE = int(os.getenv("DUCKDB_POOL_SIZE", "4"))
+PARQUET_PATH = os.getenv("PARQUET_PATH", os.path.join(DATA_DIR, "air_quality"))
+# seconds a scan of the partition tree stands for its version; new files show up within this long
+PARQUET_VERSION_TTL = float(os.getenv("PARQUET_VERSION_TTL", "2"))
+
+
+def aqi_stats(aqi):
+    aqi = np.asarray(aqi, dtype=np.float64)
+    if not len(aqi):
+        return {"mean": None, "p95": None, "max": None}
+    with timing.phase("stats"):
+        return {"mean": float(aqi.mean()), "p95": float(np.quantile(aqi, 0.95)), "max": float(aqi.max())}
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def data_version(self):
+        # the registry's version covers the seed CSV and the zip polygons it places sensors with
+        return file_version(CSV) + sensors_version()
+
+    def snapshot(self):
+        # pins one store (and its rollups) so a request's reads can't straddle an ingest flush
+        return snapshot()
+
+    def summary(self, start, end, zip=None, sensor=None):
+        sel = get_store().select(start, end, zip, sensor)
+        return sel, aqi_stats(sel.aqi)
+
+    def stats(self, start, end, zip=None, sensor=None):
+        # merged from the rollups without touching the window's raw readings; p95 is a sketch estimate
+        with timing.phase("rollups"):
+            return get_rollups().stats(start, end, [zip] if zip else None, sensor)
+
+    def buckets(self, start, end, zip, bucket, agg, sensor=None):
+        # 10-minute buckets are finer than the rollups; everything else reads them
+        if bucket == "10m":
+            sel = get_store().select(start, end, zip, sensor)
+            with timing.phase("buckets"):
+                return bucketize(sel, bucket, agg)
+        with timing.phase("buckets"):
+            return get_rollups().buckets(start, end, zip, bucket, agg, sensor)
+
+    def zip_stats(self, start, end):
+        """Per-zip mean/p95/max AQI and reading count, merged from the rollups (p95 is a sketch estimate)."""
+        rollups = get_rollups()
+        with timing.phase("rollups"):
+            window = rollups.window(start, end)
+        return {str(rollups.zips[code]): {"mean": float(total / n), "p95": sketch.quantile(hist, 0.95),
+                                     "max": float(mx), "count": int(n)}
+                for code, (n, total, mx, hist) in window.items()}
+
+    def sensors(self):
+        # the seed registry plus any sensor only seen in the readings (ingest can add them)
+        return get_sensors().with_readings(get_store())
+
+    def sensor_counts(self):
+        return self.sensors().counts()
+
+
+class DuckDBBackend:
+    """Read-only DuckDB backend.
+
+    DuckDB connections must not be used from two threads at once, so each
+    query borrows one from a fixed-size pool and returns it afterwards.
+    """
+    name = "duckdb"
+
+    def __init__(self, path=DUCKDB_PATH, pool_size=DUCKDB_POOL_SIZE):
+        self.path = path
+        self._registry = None
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
+    def _connect(self):
+        import duckdb  # optional: only needed for this backend
+        return duckdb.connect(self.path, read_only=True)
+
+    def data_version(self):
+        return file_version(self.path)
+
+    def snapshot(self):
+        return nullcontext()
+
+    @contextmanager
+    def _conn(self):
+        conn = self._pool.get()
+        try:
+            with timing.phase("query"):
+                yield conn
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+    @staticmethod
+    def _where(start, end, zip=None, sensor=None):
+        # Timestamp is a naive TIMESTAMP column holding UTC; bind bounds as epoch microseconds
+        clause = "Timestamp BETWEEN make_timestamp(?) AND make_timestamp(?)"
+        params = [to_ns(start) // 1000, to_ns(end) // 1000]
+        if sensor is not None:
+            clause, params = clause + " AND Sensor_ID = ?", [*params, sensor]
+        if zip:
+            return clause + " AND Zip_Code = ?", [*params, zip]
+        return clause, params
+
+    def summary(self, start, end, zip=None, sensor=None):
+        where, params = self._where(start, end, zip, sensor)
+        with self._conn() as conn:
+            cols = conn.execute(
+                f"SELECT epoch_ns(Timestamp) AS ts, Zip_Code, Sensor_ID, PM2_5, AQI FROM air_quality "
+                f"WHERE {where} ORDER BY Timestamp, Zip_Code, Sensor_ID", params).fetchnumpy()
+        sel = Selection.from_columns(cols["ts"], cols["Zip_Code"], cols["Sensor_ID"], cols["PM2_5"], cols["AQI"])
+        timing.rows(scanned=len(sel))
+        return sel, self.stats(start, end, zip, sensor)
+
+    def stats(self, start, end, zip=None, sensor=None):
+        where, params = self._where(start, end, zip, sensor)
+        with self._conn() as conn:
+            mean, p95, mx = conn.execute(
+                f"SELECT avg(AQI), quantile_cont(AQI, 0.95), max(AQI) FROM air_quality WHERE {where}",
+                params).fetchone()
+        return {"mean": mean, "p95": p95, "max": None if mx is None else float(mx)}
+
+    def buckets(self, start, end, zip, bucket, agg, sensor=None):
+        where, params = self._where(start, end, zip, sensor)
+        width = {"10m": "10 minutes", "1h": "1 hour", "1d": "1 day", "1w": "1 week"}[bucket]
+        fn = {"mean": "avg({})", "max": "max({})", "p95": "quantile_cont({}, 0.95)"}[agg]
+        with self._conn() as conn:
+            cols = conn.execute(
+                f"SELECT epoch_ns(time_bucket(INTERVAL '{width}', Timestamp)) AS ts, Zip_Code, "
+                f"{fn.format('PM2_5')} AS pm25, {fn.format('AQI')} AS aqi, count(*) AS n "
+                f"FROM air_quality WHERE {where} GROUP BY ALL ORDER BY ts, Zip_Code", params).fetchnumpy()
+        zips, codes = np.unique(np.asarray(cols["Zip_Code"], dtype=str), return_inverse=True)
+        return Buckets(np.asarray(cols["ts"], np.int64), codes.astype(np.int32), zips,
+                       np.asarray(cols["pm25"], np.float64), np.asarray(cols["aqi"], np.float64),
+                       np.asarray(cols["n"], np.int64))
+
+    def zip_stats(self, start, end):
+        where, params = self._where(start, end)
+        with self._conn() as conn:
+            rows = conn.execute(
+                f"SELECT Zip_Code, avg(AQI), quantile_cont(AQI, 0.95), max(AQI), count(*) "
+                f"FROM air_quality WHERE {where} GROUP BY Zip_Code", params).fetchall()
+        return {z: {"mean": mean, "p95": p95, "max": float(mx), "count": n} for z, mean, p95, mx, n in rows}
+
+    def sensors(self):
+        # sensors are only known from their readings here; the registry is rebuilt per file version
+        version = self.data_version()
+        registry = self._registry
+        if registry is None or registry.version != version:
+            with self._conn() as conn, timing.load("sensors", self.name):
+                registry = self._registry = SensorRegistry.from_duckdb(conn, version)
+        return registry
+
+    def sensor_counts(self):
+        return self.sensors().counts()
+
+
+def _month(ns):
+    m = int(np.datetime64(ns, "ns").astype("datetime64[M]").astype(np.int64))
+    return m // 12 + 1970, m % 12 + 1
+
+
+class ParquetBackend(DuckDBBackend):
+    """DuckDB over hive-partitioned Parquet (zip=/year=/month=).
+
+    Each pooled in-memory connection exposes the files as an ``air_quality``
+    view, so every query is the DuckDB backend's. ``_where`` adds predicates
+    on the partition columns, which DuckDB evaluates against the directory
+    names before opening any file; Timestamp bounds then skip row groups by
+    their statistics, and only the selected columns are read.
+    """
+    name = "parquet"
+
+    def __init__(self, path=PARQUET_PATH, pool_size=DUCKDB_POOL_SIZE, version_ttl=PARQUET_VERSION_TTL):
+        self.version_ttl = version_ttl
+        self._version = (None, float("-inf"))  # (tree version, monotonic time it expires)
+        super().__init__(path, pool_size)
+
+    def _connect(self):
+        import duckdb
+        conn = duckdb.connect()
+        files = os.path.join(self.path, "**", "*.parquet").replace("'", "''")  # views can't take parameters
+        conn.execute(
+            f"CREATE VIEW air_quality AS SELECT * FROM read_parquet('{files}', hive_partitioning = true, "
+            f"hive_types = {{'zip': VARCHAR, 'year': INTEGER, 'month': INTEGER}})")
+        return conn
+
+    def data_version(self):
+        # walking every partition file is too slow to do per request (the response cache asks
+        # twice per request, on the event loop), so one scan is reused for version_ttl seconds
+        version, expires = self._version
+        now = time.monotonic()
+        if now >= expires:
+            version = tree_version(self.path)
+            self._version = (version, now + self.version_ttl)
+        return version
+
+    @staticmethod
+    def _where(start, end, zip=None, sensor=None):
+        clause, params = DuckDBBackend._where(start, end, sensor=sensor)
+        clause += " AND (year, month) >= (?, ?) AND (year, month) <= (?, ?)"
+        params += [*_month(to_ns(start)), *_month(to_ns(end))]
+        if zip:
+            return clause + " AND zip = ?", [*params, zip]
+        return clause, params
+
+
+BACKENDS = {"memory": MemoryBackend, "duckdb": DuckDBBackend, "parquet": ParquetBackend}
+
+_backend = None
+_lock = threading.Lock()
+
+
+def get_backend():
+    """Process-wide backend selected by STORAGE_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                name = os.getenv("STORAGE_BACKEND", "memory")
+                if name not in BACKENDS:
+                    raise ValueError(f"unknown STORAGE_BACKEND {name!r} (expected one of {sorted(BACKENDS)})")
+                _backend = BACKENDS[name]()
+    return _backend
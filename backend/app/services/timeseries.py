@@ -0,0 +1,498 @@
+import json, logging, os, threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import numpy as np
+from app.services.spatial import assign_zips
+from app.utils import timing, versioned
+
+DATA_DIR = os.getenv("DATA_DIR", "./data")
+CSV = os.path.join(DATA_DIR, "processed", "aqi_timeseries.csv")
+# workers share the store as memory-mapped .npy columns under STORE_DIR (see get_store)
+SHARED = os.getenv("STORE_SNAPSHOT", "1") != "0"
+STORE_DIR = os.getenv("STORE_SNAPSHOT_DIR", os.path.join(DATA_DIR, "processed", "store"))
+# ingest flushes publish just their rows on top of the snapshot; every Nth writes a full one (see publish)
+SNAPSHOT_DELTAS = int(os.getenv("STORE_SNAPSHOT_DELTAS", "32"))
+
+log = logging.getLogger(__name__)
+
+COLUMNS = ["timestamp", "zip", "sensor_id", "pm25", "aqi"]
+COORDS = ["lat", "lon"]
+CHUNK_ROWS = 10_000
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_ns(dt):
+    """datetime/ISO str/ns int -> int64 ns since epoch (naive values are taken as UTC).
+
+    Plain datetime arithmetic, so the request path doesn't need pandas.
+    """
+    if isinstance(dt, (int, np.integer)):
+        return int(dt)
+    if isinstance(dt, np.datetime64):
+        return int(dt.astype("datetime64[ns]").astype(np.int64))
+    if isinstance(dt, str):
+        dt = datetime.fromisoformat(dt)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    d = dt - EPOCH
+    # pandas Timestamps carry nanoseconds past the microsecond
+    return (d.days * 86400 + d.seconds) * 1_000_000_000 + d.microseconds * 1000 + getattr(dt, "nanosecond", 0)
+
+
+def _f32_to_py(a):
+    # float32 -> shortest decimal repr -> float64, so 9.36 comes back as 9.36
+    # rather than 9.359999656677246
+    return a.astype(str).astype(np.float64).tolist()
+
+
+def _ts_unit(ts):
+    return "s" if not (ts % 1_000_000_000).any() else "us"
+
+
+def _iso(ts, unit=None):
+    s = np.datetime_as_string(ts.astype("datetime64[ns]"), unit=unit or _ts_unit(ts))
+    return np.char.add(s, "+00:00").tolist()
+
+
+def _extend(cats, labels):
+    """``cats`` with any new ``labels`` appended, and each label's code in the result."""
+    new = np.setdiff1d(labels, cats)
+    if len(new):
+        cats = np.r_[cats, new]
+    order = np.argsort(cats, kind="stable")
+    return cats, order[np.searchsorted(cats[order], labels)].astype(np.int32)
+
+
+def _json_num(a):
+    s = a.astype(str)
+    s[~np.isfinite(a)] = "null"
+    return s.tolist()
+
+
+class Selection:
+    """A set of rows as parallel column arrays; zip/sensor are codes into ``zips``/``sensors``."""
+
+    ARRAYS = ("ts", "zip_codes", "sensor_codes", "pm25", "aqi")
+
+    def __init__(self, ts, zip_codes, zips, sensor_codes, sensors, pm25, aqi):
+        self.ts, self.zip_codes, self.zips = ts, zip_codes, zips
+        self.sensor_codes, self.sensors = sensor_codes, sensors
+        self.pm25, self.aqi = pm25, aqi
+
+    def __len__(self):
+        return len(self.ts)
+
+    @classmethod
+    def from_columns(cls, ts, zip, sensor_id, pm25, aqi):
+        zips, zip_codes = np.unique(np.asarray(zip, dtype=str), return_inverse=True)
+        sensors, sensor_codes = np.unique(np.asarray(sensor_id, dtype=str), return_inverse=True)
+        return cls(np.asarray(ts, dtype=np.int64), zip_codes.astype(np.int32), zips,
+                   sensor_codes.astype(np.int32), sensors,
+                   np.asarray(pm25, dtype=np.float32), np.asarray(aqi, dtype=np.float32))
+
+    def save(self, directory):
+        """Write the columns and category arrays as .npy files for ``load``."""
+        for name in self.ARRAYS + ("zips", "sensors"):
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory):
+        cols = {name: np.load(os.path.join(directory, name + ".npy")) for name in cls.ARRAYS + ("zips", "sensors")}
+        return cls(cols["ts"], cols["zip_codes"], cols["zips"], cols["sensor_codes"], cols["sensors"],
+                   cols["pm25"], cols["aqi"])
+
+    def take(self, idx):
+        return Selection(self.ts[idx], self.zip_codes[idx], self.zips, self.sensor_codes[idx],
+                         self.sensors, self.pm25[idx], self.aqi[idx])
+
+    def _aqi_integral(self):
+        return bool(np.isfinite(self.aqi).all() and (self.aqi == np.round(self.aqi)).all())
+
+    def records(self):
+        aqi = self.aqi.astype(np.int64).tolist() if self._aqi_integral() else _f32_to_py(self.aqi)
+        cols = zip(_iso(self.ts), self.zips[self.zip_codes].tolist(),
+                   self.sensors[self.sensor_codes].tolist(), _f32_to_py(self.pm25), aqi)
+        return [dict(zip(COLUMNS, row)) for row in cols]
+
+    def json_rows(self, chunk=CHUNK_ROWS):
+        """Yield the rows as lists of encoded JSON objects, ``chunk`` rows at a time.
+
+        Same values as ``records()`` but formatted straight from the column
+        arrays, so memory stays bounded by the chunk size.
+        """
+        zips = np.array([json.dumps(z) for z in self.zips.tolist()])
+        sensors = np.array([json.dumps(s) for s in self.sensors.tolist()])
+        unit, integral = _ts_unit(self.ts), self._aqi_integral()
+        for a in range(0, len(self), chunk):
+            b = a + chunk
+            aqi = self.aqi[a:b]
+            cols = zip(_iso(self.ts[a:b], unit), zips[self.zip_codes[a:b]].tolist(),
+                       sensors[self.sensor_codes[a:b]].tolist(), _json_num(self.pm25[a:b]),
+                       aqi.astype(np.int64).astype(str).tolist() if integral else _json_num(aqi))
+            yield [f'{{"timestamp":"{t}","zip":{z},"sensor_id":{s},"pm25":{p},"aqi":{q}}}'
+                   for t, z, s, p, q in cols]
+
+    def columns(self):
+        """Column-oriented layout: dictionary-encoded zip/sensor_id and delta-encoded timestamps.
+
+        ``timestamp`` decodes as ``base + cumsum(deltas)`` epoch ``unit``s (UTC).
+        """
+        unit = _ts_unit(self.ts)
+        t = self.ts // (1_000_000_000 if unit == "s" else 1_000)
+        base = int(t[0]) if len(t) else 0
+        aqi = self.aqi.astype(np.int64).tolist() if self._aqi_integral() else _f32_to_py(self.aqi)
+        return {
+            "length": len(self),
+            "timestamp": {"unit": unit, "base": base, "deltas": np.diff(t, prepend=base).tolist()},
+            "zip": {"dictionary": self.zips.tolist(), "codes": self.zip_codes.tolist()},
+            "sensor_id": {"dictionary": self.sensors.tolist(), "codes": self.sensor_codes.tolist()},
+            "pm25": _f32_to_py(self.pm25),
+            "aqi": aqi,
+        }
+
+    def to_arrow(self):
+        import pyarrow as pa  # optional: only needed for Arrow responses
+        aqi = pa.array(self.aqi.astype(np.int32)) if self._aqi_integral() else pa.array(self.aqi)
+        return pa.table({
+            "timestamp": pa.array(self.ts, pa.timestamp("ns", tz="UTC")),
+            "zip": pa.DictionaryArray.from_arrays(pa.array(self.zip_codes), pa.array(self.zips.tolist())),
+            "sensor_id": pa.DictionaryArray.from_arrays(pa.array(self.sensor_codes),
+                                                        pa.array(self.sensors.tolist())),
+            "pm25": pa.array(self.pm25),
+            "aqi": aqi,
+        })
+
+
+class TimeseriesStore:
+    """Typed, columnar, read-only copy of processed/aqi_timeseries.csv.
+
+    timestamps are int64 ns (UTC), zip/sensor are int32 codes into the
+    ``zips``/``sensors`` category arrays, pm25/aqi are float32.
+
+    Rows are kept sorted by (zip, timestamp) and ``offsets[z]:offsets[z + 1]``
+    is the block for zip code ``z``, so a window query is two binary
+    searches per zip instead of full-column masks and a sort.
+
+    A store is never modified: ``append`` returns a new one, so a reader
+    holding a store sees one consistent snapshot. ``rollups`` is set by
+    app.services.rollups and travels with the snapshot it summarizes.
+    """
+
+    ARRAYS = ("ts", "zip_codes", "sensor_codes", "pm25", "aqi", "offsets")
+
+    def __init__(self, ts, zip_codes, zips, sensor_codes, sensors, pm25, aqi, version=None, presorted=False,
+                 offsets=None):
+        if not presorted:
+            order = np.lexsort((ts, zip_codes))
+            if (order != np.arange(len(order))).any():
+                ts, zip_codes, sensor_codes = ts[order], zip_codes[order], sensor_codes[order]
+                pm25, aqi = pm25[order], aqi[order]
+        self.ts, self.zip_codes, self.zips = ts, zip_codes, zips
+        self.sensor_codes, self.sensors = sensor_codes, sensors
+        self.pm25, self.aqi = pm25, aqi
+        self.version = version
+        self.rollups = None
+        self.offsets = np.searchsorted(zip_codes, np.arange(len(zips) + 1)) if offsets is None else offsets
+        self.zip_index = {z: i for i, z in enumerate(zips.tolist())}
+        self.sensor_index = {s: i for i, s in enumerate(sensors.tolist())}
+
+    def __len__(self):
+        return len(self.ts)
+
+    @classmethod
+    def from_csv(cls, path, version=None):
+        import pandas as pd  # deferred: most starts map a snapshot and never parse the CSV
+        df = pd.read_csv(path, usecols=lambda c: c in COLUMNS or c in COORDS, dtype={"zip": str, "sensor_id": str})
+        if "lat" in df and "lon" in df and ("zip" not in df or df["zip"].isna().any()):
+            # readings without a zip are assigned one from the polygon containing them
+            df["zip"] = assign_zips(df["lon"], df["lat"], df.get("zip"))
+        ts = pd.to_datetime(df["timestamp"], utc=True).dt.tz_localize(None).to_numpy("datetime64[ns]").view(np.int64)
+        sel = Selection.from_columns(ts, df["zip"], df["sensor_id"], df["pm25"], df["aqi"])
+        return cls(sel.ts, sel.zip_codes, sel.zips, sel.sensor_codes, sel.sensors, sel.pm25, sel.aqi, version)
+
+    def save(self, directory):
+        """Write the columns (and the zip offsets) as .npy files for ``load``, plus the rollup
+        tables built so far under ``rollups/``."""
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+        np.save(os.path.join(directory, "zips.npy"), self.zips)
+        np.save(os.path.join(directory, "sensors.npy"), self.sensors)
+        if self.rollups is not None:
+            self.rollups.save(os.path.join(directory, "rollups"))
+
+    @classmethod
+    def load(cls, directory, version=None):
+        """Store over files written by ``save``, with the columns memory-mapped read-only:
+        every process mapping the same files shares one copy through the page cache."""
+        cols = {name: np.asarray(np.load(os.path.join(directory, name + ".npy"), mmap_mode="r"))
+                for name in cls.ARRAYS}
+        store = cls(cols["ts"], cols["zip_codes"], np.load(os.path.join(directory, "zips.npy")),
+                    cols["sensor_codes"], np.load(os.path.join(directory, "sensors.npy")),
+                    cols["pm25"], cols["aqi"], version, presorted=True, offsets=cols["offsets"])
+        if os.path.isdir(os.path.join(directory, "rollups")):
+            from app.services.rollups import Rollups  # that module imports this one
+            store.rollups = Rollups.load(store, os.path.join(directory, "rollups"))
+        return store
+
+    def append(self, sel, version=None):
+        """(new store with ``sel``'s rows added, ``sel`` recoded against the new store).
+
+        New zips and sensors get codes after the existing ones, so codes held
+        by earlier snapshots (and their rollups) stay valid. The batch is
+        sorted and merged into each zip's block with one ``np.insert`` per
+        column, linear in the store size rather than a full re-sort.
+        """
+        zips, zc = _extend(self.zips, sel.zips)
+        sensors, sc = _extend(self.sensors, sel.sensors)
+        zc, sc = zc[sel.zip_codes], sc[sel.sensor_codes]
+        order = np.lexsort((sel.ts, zc))
+        batch = Selection(sel.ts[order], zc[order], zips, sc[order], sensors, sel.pm25[order], sel.aqi[order])
+        pos = np.full(len(batch), len(self), np.int64)  # zips new to the store go at the end
+        bounds = np.searchsorted(batch.zip_codes, np.arange(len(self.zips) + 1))
+        for code in np.flatnonzero(np.diff(bounds)):
+            a, b = bounds[code], bounds[code + 1]
+            s, e = self.offsets[code], self.offsets[code + 1]
+            pos[a:b] = s + np.searchsorted(self.ts[s:e], batch.ts[a:b], "right")
+        store = TimeseriesStore(
+            np.insert(self.ts, pos, batch.ts), np.insert(self.zip_codes, pos, batch.zip_codes), zips,
+            np.insert(self.sensor_codes, pos, batch.sensor_codes), sensors,
+            np.insert(self.pm25, pos, batch.pm25), np.insert(self.aqi, pos, batch.aqi), version, presorted=True)
+        return store, batch
+
+    def _range(self, code, lo_ns, hi_ns):
+        a, b = self.offsets[code], self.offsets[code + 1]
+        block = self.ts[a:b]
+        return a + np.searchsorted(block, lo_ns, "left"), a + np.searchsorted(block, hi_ns, "right")
+
+    def _slice(self, a, b):
+        return Selection(self.ts[a:b], self.zip_codes[a:b], self.zips, self.sensor_codes[a:b],
+                         self.sensors, self.pm25[a:b], self.aqi[a:b])
+
+    def select(self, start, end, zip=None, sensor=None):
+        """Rows with start <= timestamp <= end (optionally for one zip and/or sensor), in time order."""
+        lo_ns, hi_ns = to_ns(start), to_ns(end)
+        with timing.phase("select"):
+            if zip:
+                code = self.zip_index.get(zip)
+                sel = self._slice(0, 0) if code is None else self._slice(*self._range(code, lo_ns, hi_ns))  # views
+            else:
+                ranges = [self._range(code, lo_ns, hi_ns) for code in range(len(self.zips))]
+                idx = np.concatenate([np.arange(a, b) for a, b in ranges]) if ranges else np.arange(0)
+                sel = self._slice(0, len(self)).take(idx)
+            timing.rows(scanned=len(sel))
+            if sensor is not None:
+                sel = sel.take(np.flatnonzero(sel.sensor_codes == self.sensor_index.get(sensor, -1)))
+        if zip:
+            return sel
+        with timing.phase("sort"):
+            return sel.take(np.argsort(sel.ts, kind="stable"))
+
+
+_store = None
+_lock = threading.Lock()
+_pinned = ContextVar("pinned_store", default=None)
+
+
+def _file_version(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _build(path, version=None):
+    """Store parsed from the CSV, with the PREBUILT rollup tables (saved with a snapshot)."""
+    from app.services.rollups import Rollups
+    with timing.load("timeseries", "csv"):
+        store = TimeseriesStore.from_csv(path, version)
+    store.rollups = Rollups(store).prebuild()
+    return store
+
+
+def _chain(name):
+    """Versions from the full snapshot ``name`` builds on up to ``name`` itself.
+
+    A version is either a full snapshot or a delta: one ingest flush's rows,
+    with meta.json naming the version they were appended to as ``base``.
+    """
+    chain = [name]
+    while (base := versioned.meta(STORE_DIR, chain[0]).get("base")) is not None:
+        chain.insert(0, base)
+    return chain
+
+
+def _stale(name, source):
+    # snapshots from before rollups were saved with them count as stale too, so they get rebuilt once;
+    # so does a delta chain with a missing link
+    try:
+        return (name is None or tuple(versioned.meta(STORE_DIR, name)["source"]) != source
+                or not os.path.isdir(os.path.join(STORE_DIR, _chain(name)[0], "rollups")))
+    except FileNotFoundError:
+        return True
+
+
+def _replaced(name):
+    """The chain a full snapshot ``name`` took over from (see publish), oldest first."""
+    after = versioned.meta(STORE_DIR, name).get("after")
+    return _chain(after) if after is not None else []
+
+
+def _missed(name, have):
+    """Directories of the batches a full snapshot ``name`` folded in after version ``have``."""
+    try:
+        chain = _replaced(name)
+    except FileNotFoundError:  # cleaned up already
+        return []
+    if have not in chain:
+        return []
+    later = chain[chain.index(have) + 1:]
+    return [os.path.join(STORE_DIR, v) for v in later] + [os.path.join(STORE_DIR, name, "batch")]
+
+
+def _announce(store, batch):
+    # another worker's flush, applied here: this worker's live subscribers get it too
+    from app.services import live  # that module imports this one
+    try:
+        live.get_broker().publish_batch(store, batch)
+    except Exception:
+        log.exception("live update failed")
+
+
+def _open(name, have=None):
+    """Store for version ``name``: a full snapshot is mapped, a delta's rows are appended to its
+    base, which is ``have`` when that is the base (then only the new rows are applied).
+
+    Rows newer than ``have`` are announced to the live subscribers, so a
+    flush reaches them whichever worker ran it. When a full snapshot took
+    over from the chain ``have`` is on, that chain's later deltas (kept
+    until the next full snapshot, see publish) and the snapshot's own batch
+    are announced; a worker further behind than that misses them.
+    """
+    if have is not None and have.version[0] == name:
+        return have
+    info = versioned.meta(STORE_DIR, name)
+    version = (name, tuple(info["source"]))
+    if info.get("base") is None:
+        with timing.load("timeseries", "snapshot"):
+            store = TimeseriesStore.load(os.path.join(STORE_DIR, name), version)
+        if have is not None:
+            # category codes only ever grow, so older batches' codes hold in the new store
+            for directory in _missed(name, have.version[0]):
+                _announce(store, Selection.load(directory))
+        return store
+    base = _open(info["base"], have)
+    with timing.load("timeseries", "delta"):
+        store, batch = base.append(Selection.load(os.path.join(STORE_DIR, name)), version)
+        if base.rollups is not None:
+            store.rollups = base.rollups.add(store, batch)
+    if have is not None:
+        _announce(store, batch)
+    return store
+
+
+def _load_shared(path, rebuild=False, have=None):
+    """The published store, first building it from the CSV if there is none, the CSV
+    has changed, or ``rebuild`` is set. ``have`` is a store already loaded here that
+    the current version may build on."""
+    with versioned.locked(STORE_DIR):
+        source = _file_version(path)
+        name = versioned.current(STORE_DIR)
+        if rebuild or _stale(name, source):
+            store = _build(path)
+            name = versioned.publish(STORE_DIR, store.save, {"source": source, "rows": len(store)})
+            have = None
+        return _open(name, have)
+
+
+def _version(path):
+    return (versioned.current(STORE_DIR), _file_version(path)) if SHARED else _file_version(path)
+
+
+def get_store(path=CSV):
+    """Process-wide store, reloaded when the CSV's mtime or size changes.
+
+    With STORE_SNAPSHOT on (the default) the store is the memory-mapped copy
+    published under STORE_DIR, so N workers hold one copy of the columns
+    instead of N; a new published version is picked up on the next call
+    (after an ingest flush, by appending just that flush's rows).
+    """
+    global _store
+    store = _pinned.get()
+    if store is not None:
+        return store
+    version = _version(path)
+    store = _store
+    if store is not None and store.version == version:
+        return store
+    with _lock:
+        if _store is None or _store.version != _version(path):
+            _store = _load_shared(path, have=_store) if SHARED else _build(path, version)
+        return _store
+
+
+def rebuild_snapshot(path=CSV):
+    """Parse the CSV and publish a fresh snapshot (columns and PREBUILT rollups) even if one is current."""
+    global _store
+    with _lock:
+        _store = _load_shared(path, rebuild=True)
+        return _store
+
+
+def publish(base, store, persist=None, path=CSV, batch=None):
+    """Swap ``store`` (``base.append``'s result, ``batch`` its recoded rows) in as the process-wide store.
+
+    ``persist()`` runs first, under the lock, to write the new rows to the
+    CSV; the store then takes the file's new version so the write doesn't
+    trigger a reload. When shared, the store is also published under
+    STORE_DIR for the other workers. Rewriting the whole snapshot costs
+    time in the store's size, so with ``batch`` given only the batch is
+    written, as a delta on ``base``'s version, which other workers append
+    to the store they hold. Every SNAPSHOT_DELTAS-th delta is a full
+    snapshot instead, and the store is swapped for its mapped copy, so
+    delta chains stay short and workers go back to sharing one copy. The
+    chain a full snapshot replaces, and the batch it folds in, are kept
+    until the next one, for workers still announcing them to their live
+    subscribers (see _open).
+    Returns False without doing any of that if ``base`` is no longer
+    current (here, or in another worker).
+    """
+    global _store
+    with _lock, versioned.locked(STORE_DIR) if SHARED else nullcontext():
+        if _store is not base or (SHARED and versioned.current(STORE_DIR) != base.version[0]):
+            return False
+        if persist is not None:
+            persist()
+        source = _file_version(path)
+        chain = _chain(base.version[0]) if SHARED and batch is not None else None
+        if chain is not None and len(chain) <= SNAPSHOT_DELTAS:
+            info = {"source": source, "rows": len(store), "base": base.version[0]}
+            keep = chain + _replaced(chain[0])
+            store.version = (versioned.publish(STORE_DIR, batch.save, info, keep=keep), source)
+        elif SHARED:
+            info = {"source": source, "rows": len(store)}
+            if batch is not None:  # so workers still on base's chain can announce its rows (see _open)
+                info["after"] = base.version[0]
+
+            def write(directory):
+                store.save(directory)
+                if batch is not None:
+                    os.makedirs(os.path.join(directory, "batch"))
+                    batch.save(os.path.join(directory, "batch"))
+            name = versioned.publish(STORE_DIR, write, info, keep=chain or ())
+            # the mapped copy comes with the rollup tables store.save just wrote
+            store = TimeseriesStore.load(os.path.join(STORE_DIR, name), (name, source))
+        else:
+            store.version = source
+        _store = store
+        return True
+
+
+@contextmanager
+def snapshot():
+    """Pin the current store for the body, so several reads in one request see the same data."""
+    token = _pinned.set(get_store())
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
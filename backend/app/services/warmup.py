@@ -0,0 +1,88 @@
+"""Startup warm-up and readiness.
+
+The lifespan runs ``warm()`` on a thread and lets the server accept
+connections right away: /health answers as soon as the process is up,
+while /ready reports 503 until every dataset below is loaded, then 200
+with how long each step took. With a current snapshot under STORE_DIR the
+store and its prebuilt rollups are only memory-mapped, so readiness costs
+about the pandas import (sensors) plus milliseconds; without one, the
+first worker parses the CSV and publishes a snapshot for the others.
+
+    PYTHONPATH=backend DATA_DIR=./data python -m app.services.warmup [--rebuild]
+
+builds the snapshot ahead of time (``make snapshot``), e.g. while baking
+an image, so no pod pays for the CSV parse.
+"""
+import argparse, logging, os, threading, time
+from app.services import geojson, spatial, storage, timeseries
+
+log = logging.getLogger(__name__)
+
+
+def _store():
+    if storage.get_backend().name == "memory" and os.path.exists(timeseries.CSV):
+        from app.services.rollups import get_rollups
+        get_rollups().prebuild()
+
+
+def _geojson():
+    if os.path.exists(geojson.GJ):
+        geojson.get_encoded()
+        spatial.get_zip_index()
+
+
+def _sensors():
+    storage.get_backend().sensors()
+
+
+STEPS = [("timeseries", _store), ("geojson", _geojson), ("sensors", _sensors)]
+
+
+class Readiness:
+    def __init__(self):
+        self.ready = False
+        self.error = None
+        self.steps = {}
+        self.started = self.seconds = None
+        self._lock = threading.Lock()
+
+    def status(self):
+        with self._lock:
+            return {"ready": self.ready, "seconds": self.seconds, "steps": dict(self.steps), "error": self.error}
+
+
+readiness = Readiness()
+
+
+def warm(state=readiness):
+    """Load every dataset the API serves, recording each step's duration on ``state``."""
+    state.started = t0 = time.perf_counter()
+    try:
+        for name, step in STEPS:
+            t = time.perf_counter()
+            step()
+            with state._lock:
+                state.steps[name] = round(time.perf_counter() - t, 4)
+    except Exception as e:  # stay unready (and say why) rather than crash the worker
+        log.exception("warm-up failed")
+        with state._lock:
+            state.error = f"{type(e).__name__}: {e}"
+        return False
+    with state._lock:
+        state.ready, state.seconds = True, round(time.perf_counter() - t0, 4)
+    return True
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rebuild", action="store_true", help="re-parse the CSV even if the snapshot is current")
+    args = ap.parse_args()
+    if args.rebuild and timeseries.SHARED and os.path.exists(timeseries.CSV):
+        timeseries.rebuild_snapshot()
+    ok = warm()
+    print(readiness.status())
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
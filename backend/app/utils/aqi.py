@@ -0,0 +1,70 @@
+"""US EPA PM2.5 -> AQI conversion and AQI categories/colors, vectorized.
+
+Concentrations are truncated to 0.1 ug/m3 as the EPA specifies, which
+closes the gaps between breakpoint rows (12.05 reads as 12.0, AQI 50),
+and then interpolated within the row found by ``np.searchsorted``.
+Readings above the top breakpoint are capped at 500; negative ones
+read as 0.
+"""
+import numpy as np
+
+# (C_low, C_high, I_low, I_high) per row
+BREAKPOINTS = np.array([
+    (0.0, 12.0, 0, 50), (12.1, 35.4, 51, 100), (35.5, 55.4, 101, 150), (55.5, 150.4, 151, 200),
+    (150.5, 250.4, 201, 300), (250.5, 350.4, 301, 400), (350.5, 500.4, 401, 500),
+])
+C_LOW, C_HIGH, I_LOW, I_HIGH = BREAKPOINTS.T
+
+# upper AQI bound of each category (inclusive), name, color
+CATEGORIES = [
+    (50, "Good", "#00e400"),
+    (100, "Moderate", "#ffff00"),
+    (150, "Unhealthy (Sensitive)", "#ff7e00"),
+    (200, "Unhealthy", "#ff0000"),
+    (300, "Very Unhealthy", "#8f3f97"),
+    (np.inf, "Hazardous", "#7e0023"),
+]
+UPPER = np.array([c[0] for c in CATEGORIES], np.float64)
+NAMES = np.array([c[1] for c in CATEGORIES], dtype=object)
+COLORS = np.array([c[2] for c in CATEGORIES], dtype=object)
+
+
+def _interpolate(c):
+    # c is already truncated to 0.1 and within [0, C_HIGH[-1]]
+    row = np.searchsorted(C_HIGH, c, "left")
+    return np.rint((I_HIGH[row] - I_LOW[row]) / (C_HIGH[row] - C_LOW[row]) * (c - C_LOW[row]) + I_LOW[row])
+
+
+# truncation leaves only 5005 distinct in-range concentrations, so the
+# conversion is a table lookup by tenths; the last slot is the 500 cap
+TABLE = np.r_[_interpolate(np.arange(round(C_HIGH[-1] * 10) + 1) / 10), 500.0]
+
+
+def pm25_to_aqi(pm25):
+    """Integer AQI (as float64, NaN where pm25 is NaN) per PM2.5 concentration."""
+    # the epsilon keeps e.g. 12.1 from truncating to 12.0 through 120.99999 float noise
+    shape = np.shape(pm25)
+    tenths = np.array(pm25, np.float64, ndmin=1) * 10
+    tenths += 1e-6
+    np.clip(tenths, 0, len(TABLE) - 1, out=tenths)
+    nan = np.isnan(tenths)
+    if nan.any():
+        tenths[nan] = 0
+        out = TABLE[tenths.astype(np.intp)]
+        out[nan] = np.nan
+        return out.reshape(shape)
+    return TABLE[tenths.astype(np.intp)].reshape(shape)
+
+
+def category_codes(aqi):
+    """Index into CATEGORIES per AQI value (-1 for NaN)."""
+    aqi = np.asarray(aqi, np.float64)
+    codes = np.searchsorted(UPPER, aqi, "left")
+    return np.where(np.isnan(aqi), -1, codes)
+
+
+def categories(aqi):
+    """(names, colors) per AQI value; None where the value is NaN."""
+    codes = category_codes(aqi)
+    names, colors = np.r_[NAMES, [None]][codes], np.r_[COLORS, [None]][codes]
+    return names, colors
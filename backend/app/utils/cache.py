@@ -0,0 +1,149 @@
+"""Response cache shared by the /api/v1 routes.
+
+Entries are keyed on (path, normalized query, Accept) and tagged with the
+data version of the route, so a new `make seed`/ingest invalidates them
+without any explicit purge. The ETag is derived from the key and the data
+version alone, so a matching If-None-Match is answered with 304 before
+the route runs, even after the entry itself has been evicted.
+"""
+import hashlib, os, threading, time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+from app.utils.timing import PROFILE_SCOPE_KEY
+
+CACHE_MAX_BYTES = int(os.getenv("API_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL = float(os.getenv("API_CACHE_TTL", "0")) or None  # seconds; unset/0 means no expiry
+
+
+def file_version(*paths):
+    """(mtime_ns, size) per path, None for missing files."""
+    out = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            out.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            out.append(None)
+    return tuple(out)
+
+
+def tree_version(root, suffix=".parquet"):
+    """(file count, newest mtime_ns, total size) of the ``suffix`` files under root."""
+    n = newest = size = 0
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if name.endswith(suffix):
+                st = os.stat(os.path.join(dirpath, name))
+                n, newest, size = n + 1, max(newest, st.st_mtime_ns), size + st.st_size
+    return (n, newest, size)
+
+
+class ResponseCache:
+    """Thread-safe LRU of response bodies with a byte budget and optional TTL."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        self.max_bytes, self.ttl = max_bytes, ttl
+        self.max_entry_bytes = max_bytes // 4
+        self._entries = OrderedDict()  # key -> (version, expires, status, headers, body)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, version):
+        with self._lock:
+            e = self._entries.get(key)
+            if e is None or e[0] != version or (e[1] is not None and e[1] < time.monotonic()):
+                if e is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return e[2:]
+
+    def put(self, key, version, status, headers, body):
+        if len(body) > self.max_entry_bytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (version, expires, status, headers, body)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        self._bytes -= len(self._entries.pop(key)[4])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+def _header(scope, name):
+    for k, v in scope["headers"]:
+        if k == name:
+            return v.decode("latin-1")
+    return None
+
+
+class CacheMiddleware:
+    """ASGI middleware caching GET responses for the routes in ``versions``.
+
+    ``versions`` maps a path to a zero-arg callable returning that route's
+    current data version (anything hashable).
+    """
+
+    def __init__(self, app, cache, versions):
+        self.app, self.cache, self.versions = app, cache, versions
+
+    async def __call__(self, scope, receive, send):
+        version_of = self.versions.get(scope.get("path")) if scope["type"] == "http" else None
+        if version_of is None or scope["method"] != "GET" or scope.get(PROFILE_SCOPE_KEY):
+            return await self.app(scope, receive, send)
+
+        query = urlencode(sorted(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)))
+        key = (scope["path"], query, _header(scope, b"accept") or "")
+        version = version_of()
+        etag = '"%s"' % hashlib.blake2b(repr((key, version)).encode(), digest_size=12).hexdigest()
+
+        inm = _header(scope, b"if-none-match")
+        if inm and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]):
+            await send({"type": "http.response.start", "status": 304,
+                        "headers": [(b"etag", etag.encode()), (b"x-cache", b"HIT")]})
+            return await send({"type": "http.response.body", "body": b""})
+
+        hit = self.cache.get(key, version)
+        if hit is not None:
+            status, headers, body = hit
+            await send({"type": "http.response.start", "status": status,
+                        "headers": headers + [(b"x-cache", b"HIT")]})
+            return await send({"type": "http.response.body", "body": body})
+
+        state = {"status": None, "headers": None, "chunks": [], "size": 0}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                if message["status"] == 200:
+                    message["headers"] = list(message.get("headers", [])) + [(b"etag", etag.encode())]
+                state["headers"] = [h for h in message["headers"] if h[0] != b"x-cache"]
+                message["headers"] = state["headers"] + [(b"x-cache", b"MISS")]
+            elif message["type"] == "http.response.body" and state["chunks"] is not None:
+                state["chunks"].append(message.get("body", b""))
+                state["size"] += len(state["chunks"][-1])
+                if state["size"] > self.cache.max_entry_bytes:
+                    state["chunks"] = None  # too big to cache; keep streaming it through
+                elif not message.get("more_body") and state["status"] == 200 and version_of() == version:
+                    self.cache.put(key, version, 200, state["headers"], b"".join(state["chunks"]))
+            await send(message)
+
+        await self.app(scope, receive, capture)
@@ -0,0 +1,140 @@
+"""Async offloading for the API's blocking service calls.
+
+Heavy queries run on one bounded thread pool (``QUERY_WORKERS`` threads;
+numpy and pandas release the GIL for most of their work) rather than on
+Starlette's shared pool, so a burst of large summaries can't starve cheap
+routes. Each route goes through a Gate that caps how many of its calls run
+at once and how many may wait behind them (beyond that the route answers
+503), and coalesces identical calls already in flight onto one
+computation. ``stats()`` reports active/queued counts per gate and for
+the pool. Calls run in a copy of the caller's context, as with
+``asyncio.to_thread``, so ContextVars such as the request trace
+(app.utils.timing) follow them onto the worker thread.
+"""
+import asyncio, contextvars, os, threading
+from concurrent.futures import ThreadPoolExecutor
+
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", str(min(4, os.cpu_count() or 1))))
+QUERY_MAX_WAITING = int(os.getenv("QUERY_MAX_WAITING", "64"))
+
+
+class Overloaded(Exception):
+    """A gate's wait queue is full."""
+
+
+class QueryPool:
+    """ThreadPoolExecutor that counts queued and running calls."""
+
+    def __init__(self, workers=QUERY_WORKERS):
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self.queued = self.running = 0
+
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="query")
+        return self._pool
+
+    def _call(self, fn, args):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def run(self, fn, *args):
+        """Awaitable result of ``fn(*args)`` on the pool."""
+        with self._lock:
+            self.queued += 1
+        ctx = contextvars.copy_context()
+        return asyncio.get_running_loop().run_in_executor(self._executor(), ctx.run, self._call, fn, args)
+
+    def stats(self):
+        return {"workers": self.workers, "queued": self.queued, "running": self.running}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class Gate:
+    """Per-route concurrency limit, wait-queue bound and in-flight coalescing.
+
+    Calls with the same non-None ``key`` that overlap share one computation.
+    It runs as its own task, so the caller that started it disconnecting
+    doesn't cancel it for the others.
+    """
+
+    def __init__(self, name, limit, max_waiting=QUERY_MAX_WAITING, pool=None):
+        self.name, self.limit, self.max_waiting = name, limit, max_waiting
+        self.pool = pool
+        self._sem = self._loop = None
+        self._inflight = {}
+        self.active = self.waiting = 0
+        self.completed = self.coalesced = self.rejected = 0
+
+    async def _compute(self, fn, args):
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            if self.pool is not None:
+                return await self.pool.run(fn, *args)
+            ctx = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(None, ctx.run, fn, *args)
+        finally:
+            self.active -= 1
+            self.completed += 1
+            self._sem.release()
+
+    async def run(self, key, fn, *args):
+        """Result of ``fn(*args)``, computed off the event loop under this gate."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:  # asyncio primitives belong to one loop (a new one per test client)
+            self._loop, self._sem, self._inflight = loop, asyncio.Semaphore(self.limit), {}
+        task = self._inflight.get(key) if key is not None else None
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+        if self.active >= self.limit and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise Overloaded(self.name)
+        task = asyncio.ensure_future(self._compute(fn, args))
+        task.add_done_callback(lambda t: self._done(key, t))
+        if key is not None:
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here too, in case every caller went away first
+
+    def stats(self):
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting, "in_flight": len(self._inflight),
+                "completed": self.completed, "coalesced": self.coalesced, "rejected": self.rejected}
+
+
+pool = QueryPool()
+gates = {}
+
+
+def gate(name, limit, max_waiting=QUERY_MAX_WAITING, heavy=True):
+    """Register a route's Gate; heavy gates run on the query pool, others on the loop's default executor."""
+    gates[name] = g = Gate(name, limit, max_waiting, pool if heavy else None)
+    return g
+
+
+def stats():
+    return {"pool": pool.stats(), "routes": {name: g.stats() for name, g in gates.items()}}
@@ -0,0 +1,97 @@
+"""Polygon simplification for serving zip boundaries per map zoom level.
+
+Rings are simplified with Douglas-Peucker at a tolerance of one screen
+pixel at the requested zoom (256px web-mercator tiles, measured in
+degrees, so slightly generous away from the equator), then optionally
+quantized: rounded to the fewest decimals that still resolve a pixel,
+which is where most of the byte savings on the wire come from.
+"""
+import math
+import numpy as np
+
+MAX_ZOOM = 18  # beyond this the tolerance is well under the source precision
+
+
+def pixel_degrees(zoom):
+    """Width of one 256px-tile pixel at ``zoom``, in degrees of longitude."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def _dp_keep(pts, tolerance):
+    # iterative Douglas-Peucker; each step measures a whole span at once
+    keep = np.zeros(len(pts), bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        seg = pts[b] - pts[a]
+        rel = pts[a + 1:b] - pts[a]
+        norm = math.hypot(*seg)
+        if norm == 0:
+            d = np.hypot(rel[:, 0], rel[:, 1])
+        else:
+            d = np.abs(seg[0] * rel[:, 1] - seg[1] * rel[:, 0]) / norm
+        i = int(d.argmax())
+        if d[i] > tolerance:
+            m = a + 1 + i
+            keep[m] = True
+            stack += [(a, m), (m, b)]
+    return keep
+
+
+def simplify_ring(ring, tolerance, decimals=None):
+    """Simplified closed ring, or None if it collapses below a triangle."""
+    pts = np.asarray(ring, np.float64)[:, :2]
+    if len(pts) > 4 and tolerance > 0:
+        # split the closed ring at its far point so both halves have distinct end points
+        far = int(np.hypot(*(pts - pts[0]).T).argmax())
+        keep = np.r_[_dp_keep(pts[:far + 1], tolerance)[:-1], _dp_keep(pts[far:], tolerance)]
+        pts = pts[keep]
+    if decimals is not None:
+        pts = pts.round(decimals)
+        pts = pts[np.r_[True, (np.diff(pts, axis=0) != 0).any(axis=1)]]
+    if len(pts) < 4:
+        return None
+    return pts
+
+
+def minimal_ring(ring, decimals=None):
+    """Closed triangle standing in for a ring that simplifies away: its first point, the point
+    farthest from it, and the point farthest from the line through those two, in ring order."""
+    pts = np.asarray(ring, np.float64)[:, :2]
+    far = int(np.hypot(*(pts - pts[0]).T).argmax())
+    seg, rel = pts[far] - pts[0], pts - pts[0]
+    third = int(np.abs(seg[0] * rel[:, 1] - seg[1] * rel[:, 0]).argmax())
+    tri = pts[sorted({0, far, third})]
+    tri = np.r_[tri, tri[:1]]
+    if decimals is not None:
+        rounded = tri.round(decimals)
+        if len(np.unique(rounded[:-1], axis=0)) == 3:  # still a triangle at this precision
+            tri = rounded
+    return tri
+
+
+def _polygon(rings, tolerance, decimals):
+    out = []
+    for k, ring in enumerate(rings):
+        pts = simplify_ring(ring, tolerance, decimals)
+        if pts is None:
+            if k:
+                continue  # holes that shrink below a pixel are dropped
+            pts = minimal_ring(ring, decimals)  # never drop the outer ring, nor send it unsimplified
+        out.append(pts.tolist())
+    return out
+
+
+def simplify_geometry(geom, zoom, quantize=False):
+    """Polygon/MultiPolygon geometry simplified (and optionally quantized) for ``zoom``."""
+    if geom is None or geom.get("type") not in ("Polygon", "MultiPolygon"):
+        return geom
+    tolerance = pixel_degrees(min(zoom, MAX_ZOOM))
+    decimals = max(0, math.ceil(-math.log10(tolerance))) if quantize else None
+    if geom["type"] == "Polygon":
+        return {"type": "Polygon", "coordinates": _polygon(geom["coordinates"], tolerance, decimals)}
+    return {"type": "MultiPolygon",
+            "coordinates": [_polygon(p, tolerance, decimals) for p in geom["coordinates"]]}
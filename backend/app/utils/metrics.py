@@ -0,0 +1,115 @@
+"""Prometheus metrics without the client library: counters, gauges and histograms
+rendered in the text exposition format by ``render()`` (served at /metrics).
+
+Metrics register themselves on creation. Values are per process, so with
+several workers each one reports its own. A metric built with ``fn`` is
+read at render time instead, from a callable returning
+``{label values tuple: value}``; that's how existing stats (the response
+cache, the gates) are exposed without double bookkeeping.
+"""
+import math, threading
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = []
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v):
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        self.name, self.help, self.labels, self.fn = name, help, tuple(labels), fn
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def samples(self):
+        """(suffix, label values, extra label, value) lines for render."""
+        values = self.fn() if self.fn is not None else self.snapshot()
+        return [("", k, "", v) for k, v in sorted(values.items())]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, v in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.labels, values, extra)} {_num(v)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            h = self._values.get(key)
+            if h is None:
+                h = self._values[key] = [[0] * len(self.buckets), 0.0]
+            counts = h[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            h[1] += value
+
+    def samples(self):
+        out = []
+        with self._lock:
+            values = {k: (list(c), s) for k, (c, s) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                out.append(("_bucket", key, f'le="{_num(bound)}"', cumulative))
+            out.append(("_sum", key, "", total))
+            out.append(("_count", key, "", cumulative))
+        return out
+
+
+def render():
+    return "\n".join(m.render() for m in registry) + "\n"
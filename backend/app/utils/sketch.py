@@ -0,0 +1,101 @@
+"""Mergeable quantile sketch over fixed logarithmic bins (DDSketch-style).
+
+A sketch is a histogram of counts over bins whose edges grow by a factor
+``GAMMA``, so merging two sketches is adding their counts: any set of
+time buckets and zips can be combined in any order with the same result.
+Sketches are kept sparse as (group, bin, count) triples sorted by group
+then bin, or dense as an NBINS-long count vector once merged.
+
+Error bound: bin i covers (MIN_VALUE * GAMMA**(i-1), MIN_VALUE * GAMMA**i]
+and reads back as 2 * MIN_VALUE * GAMMA**i / (GAMMA + 1), which is within
+a relative ALPHA (0.5%) of every value in the bin. Quantiles interpolate
+between the order statistics on either side of q * (n - 1), as
+numpy.quantile does by default. Each of those is read back within ALPHA,
+so for non-negative data the estimate is within ALPHA (relative) of
+numpy.quantile, plus at most MIN_VALUE absolute for values <= MIN_VALUE
+(bin 0 reads back as 0). benchmarks/sketch_accuracy.py measures this
+against exact quantiles.
+"""
+import numpy as np
+
+ALPHA = 0.005
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+LOG_GAMMA = np.log(GAMMA)
+MIN_VALUE = 0.01
+NBINS = 2048
+
+
+def bins(values):
+    """Bin index per value; bin 0 holds everything <= MIN_VALUE."""
+    v = np.maximum(np.asarray(values, np.float64), MIN_VALUE)
+    b = np.ceil(np.log(v / MIN_VALUE) / LOG_GAMMA - 1e-9)
+    return np.minimum(b, NBINS - 1).astype(np.int64)
+
+
+def bin_values(b):
+    """Representative value per bin."""
+    b = np.asarray(b, np.int64)
+    return np.where(b == 0, 0.0, MIN_VALUE * 2 * GAMMA ** b / (GAMMA + 1))
+
+
+def group_sketch(groups, values):
+    """Triples for values labelled with (non-negative) group ids."""
+    key, counts = np.unique(np.asarray(groups, np.int64) * NBINS + bins(values), return_counts=True)
+    return key // NBINS, key % NBINS, counts
+
+
+def merge(groups, b, counts):
+    """Combine triples that share a (group, bin)."""
+    key, inv = np.unique(np.asarray(groups, np.int64) * NBINS + b, return_inverse=True)
+    return key // NBINS, key % NBINS, np.bincount(inv, weights=counts).astype(np.int64)
+
+
+def merge_sorted(a, b):
+    """``merge`` for two triple sets that are each already sorted by (group, bin)
+    with no repeats: a linear merge instead of a sort over both."""
+    ka = np.asarray(a[0], np.int64) * NBINS + a[1]
+    kb = np.asarray(b[0], np.int64) * NBINS + b[1]
+    pos = np.searchsorted(ka, kb) + np.arange(len(kb))  # where each of b lands in the merged order
+    key = np.empty(len(ka) + len(kb), np.int64)
+    counts = np.empty(len(key), np.int64)
+    in_b = np.zeros(len(key), bool)
+    in_b[pos] = True
+    key[pos], key[~in_b] = kb, ka
+    counts[pos], counts[~in_b] = b[2], a[2]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) else np.arange(0)
+    key = key[starts]
+    return key // NBINS, key % NBINS, np.add.reduceat(counts, starts) if len(starts) else counts
+
+
+def _interpolate(cum, base, total, q, value_at):
+    # numpy's default (linear) quantile: interpolate between the order
+    # statistics either side of q * (n - 1), each read back from its bin
+    pos = q * (total - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, total - 1)
+    v_lo = value_at(np.searchsorted(cum, base + lo + 1))
+    v_hi = value_at(np.searchsorted(cum, base + hi + 1))
+    return v_lo + (v_hi - v_lo) * (pos - lo)
+
+
+def group_quantile(groups, b, counts, q):
+    """(group ids, q-quantile per group) for merged triples."""
+    if not len(groups):
+        return groups, np.empty(0)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    cum = np.cumsum(counts)
+    total = np.add.reduceat(counts, starts)
+    return groups[starts], _interpolate(cum, cum[starts] - counts[starts], total, q, lambda i: bin_values(b[i]))
+
+
+def dense(b, counts):
+    """Dense NBINS-long count vector from (bin, count) pairs."""
+    return np.bincount(b, weights=counts, minlength=NBINS)
+
+
+def quantile(hist, q):
+    """q-quantile of a dense sketch, or None when it is empty."""
+    total = int(hist.sum())
+    if not total:
+        return None
+    return float(_interpolate(np.cumsum(hist), 0, total, q, bin_values))
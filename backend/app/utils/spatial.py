@@ -0,0 +1,146 @@
+"""In-memory spatial indexes: a uniform grid over bounding boxes, and
+vectorized point-in-polygon on top of it.
+
+Everything is numpy over whole coordinate arrays; the only Python loops
+are over polygons (tens) and point chunks, never over points.
+"""
+import numpy as np
+
+CHUNK_CELLS = 4_000_000  # points x edges evaluated per point-in-polygon step
+
+
+def _expand(lo, hi):
+    """Concatenated aranges [lo[i], hi[i]] (inclusive), plus the owner i of each."""
+    n = hi - lo + 1
+    owner = np.repeat(np.arange(len(lo)), n)
+    return np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + np.repeat(lo, n), owner
+
+
+class Grid:
+    """Uniform grid over item bounding boxes; each cell lists the items overlapping it.
+
+    ``bounds`` is an (n, 4) array of (minx, miny, maxx, maxy); points are
+    items with a zero-area box.
+    """
+
+    def __init__(self, bounds, size=None):
+        self.bounds = b = np.asarray(bounds, np.float64).reshape(-1, 4)
+        n = len(b)
+        self.size = size or int(np.clip(np.sqrt(n), 1, 256))
+        if n:
+            self.x0, self.y0 = b[:, 0].min(), b[:, 1].min()
+            self.dx = max(b[:, 2].max() - self.x0, 1e-12) / self.size
+            self.dy = max(b[:, 3].max() - self.y0, 1e-12) / self.size
+        else:
+            self.x0 = self.y0 = 0.0
+            self.dx = self.dy = 1.0
+        ix0, iy0 = self._cell_xy(b[:, 0], b[:, 1])
+        ix1, iy1 = self._cell_xy(b[:, 2], b[:, 3])
+        # every (item, cell) pair the item's box covers, sorted by cell
+        iy, item = _expand(iy0, np.maximum(iy1, iy0 - 1))
+        ix, row = _expand(ix0[item], np.maximum(ix1, ix0 - 1)[item])
+        cell = iy[row] * self.size + ix
+        item = item[row]
+        order = np.argsort(cell, kind="stable")
+        self.items = item[order]
+        self.offsets = np.searchsorted(cell[order], np.arange(self.size * self.size + 1))
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def _cell_xy(self, x, y):
+        # clip before the cast so out-of-extent (or infinite) coordinates land on the border cells
+        ix = np.clip((np.asarray(x, np.float64) - self.x0) // self.dx, 0, self.size - 1).astype(np.int64)
+        iy = np.clip((np.asarray(y, np.float64) - self.y0) // self.dy, 0, self.size - 1).astype(np.int64)
+        return ix, iy
+
+    def query(self, minx, miny, maxx, maxy):
+        """Ids of items whose box intersects the given box."""
+        (ix0, ix1), (iy0, iy1) = [np.sort(v) for v in self._cell_xy([minx, maxx], [miny, maxy])]
+        cells = (np.arange(iy0, iy1 + 1)[:, None] * self.size + np.arange(ix0, ix1 + 1)).ravel()
+        idx, _ = _expand(self.offsets[cells], self.offsets[cells + 1] - 1)
+        ids = np.unique(self.items[idx])
+        b = self.bounds[ids]
+        return ids[(b[:, 0] <= maxx) & (b[:, 2] >= minx) & (b[:, 1] <= maxy) & (b[:, 3] >= miny)]
+
+    def candidates(self, x, y):
+        """(point, item) index pairs where the point falls inside the item's box."""
+        x, y = np.asarray(x, np.float64), np.asarray(y, np.float64)
+        ix, iy = self._cell_xy(x, y)
+        cell = iy * self.size + ix
+        lo, hi = self.offsets[cell], self.offsets[cell + 1]
+        slot, point = _expand(lo, hi - 1)
+        item = self.items[slot]
+        b = self.bounds[item]
+        px, py = x[point], y[point]
+        inside = (px >= b[:, 0]) & (px <= b[:, 2]) & (py >= b[:, 1]) & (py <= b[:, 3])
+        return point[inside], item[inside]
+
+
+def _rings(geom):
+    if geom is None:
+        return []
+    if geom["type"] == "Polygon":
+        return geom["coordinates"]
+    if geom["type"] == "MultiPolygon":
+        return [r for p in geom["coordinates"] for r in p]
+    return []
+
+
+class PolygonIndex:
+    """Point-in-polygon lookups over GeoJSON Polygon/MultiPolygon geometries.
+
+    Uses the even-odd rule over every ring of a geometry, so holes and
+    multi-part polygons need no special casing.
+    """
+
+    def __init__(self, geometries):
+        self.edges = []  # per polygon: (x1, y1, x2, y2) arrays
+        bounds = []
+        for geom in geometries:
+            rings = [np.asarray(r, np.float64)[:, :2] for r in _rings(geom)]
+            if rings:
+                a = np.concatenate([r[:-1] for r in rings])
+                b = np.concatenate([r[1:] for r in rings])
+                self.edges.append((a[:, 0], a[:, 1], b[:, 0], b[:, 1]))
+                pts = np.concatenate(rings)
+                bounds.append((*pts.min(axis=0), *pts.max(axis=0)))
+            else:
+                empty = np.empty(0)
+                self.edges.append((empty,) * 4)
+                bounds.append((np.inf, np.inf, -np.inf, -np.inf))
+        self.grid = Grid(np.array(bounds).reshape(-1, 4))
+
+    def __len__(self):
+        return len(self.edges)
+
+    def _contains(self, poly, x, y):
+        x1, y1, x2, y2 = self.edges[poly]
+        out = np.empty(len(x), bool)
+        step = max(1, CHUNK_CELLS // max(len(x1), 1))
+        for s in range(0, len(x), step):
+            px, py = x[s:s + step, None], y[s:s + step, None]
+            crosses = (y1 > py) != (y2 > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                xi = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            out[s:s + step] = (crosses & (px < xi)).sum(axis=1) % 2 == 1
+        return out
+
+    def locate(self, x, y):
+        """Index of the polygon containing each point, or -1 (first match wins on overlaps)."""
+        x, y = np.asarray(x, np.float64), np.asarray(y, np.float64)
+        out = np.full(len(x), -1, np.int64)
+        point, poly = self.grid.candidates(x, y)
+        order = np.argsort(poly, kind="stable")
+        point, poly = point[order], poly[order]
+        bounds = np.searchsorted(poly, np.arange(len(self) + 1))
+        for p in range(len(self) - 1, -1, -1):  # reversed so lower ids overwrite higher ones
+            pts = point[bounds[p]:bounds[p + 1]]
+            if len(pts):
+                pts = pts[self._contains(p, x[pts], y[pts])]
+                out[pts] = p
+        return out
+
+    def query(self, minx, miny, maxx, maxy):
+        """Ids of polygons whose bounding box intersects the given box."""
+        return self.grid.query(minx, miny, maxx, maxy)
@@ -0,0 +1,199 @@
+"""Where request time goes: per-phase timings, Server-Timing headers and opt-in profiling.
+
+Service code wraps its steps in ``phase(name)`` (select, sort, stats,
+rollups, records, encode, ...). Every phase is observed in the
+``fha_phase_seconds`` histogram; inside a request it is also added to that
+request's Trace, which TimingMiddleware turns into a ``Server-Timing``
+header (phases that finish after the headers went out, e.g. in a streamed
+body, only reach the histogram). The trace lives in a ContextVar, so it
+follows the work onto the query pool (app.utils.concurrency runs calls in
+the caller's context). A computation shared by coalesced requests is
+traced for the request that started it.
+
+With PROFILE_REQUESTS=1, ``?profile=1`` returns a profile of the request's
+off-loop work (not a streamed body's chunks) instead of its body:
+pyinstrument's sampled call tree if it is installed, else cProfile's top
+functions by cumulative time. Leave it off in production: the report
+exposes code paths and a profiled request bypasses the response cache.
+"""
+import io, os, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import parse_qsl, urlencode
+from app.utils import metrics
+
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))  # pyinstrument sampling interval, seconds
+PROFILE_SCOPE_KEY = "fha.profile"  # set on profiled requests' scope so CacheMiddleware passes them through
+
+REQUEST_SECONDS = metrics.Histogram("fha_request_duration_seconds", "Request latency, to the end of the body",
+                                    ("route", "method", "status"))
+PHASE_SECONDS = metrics.Histogram("fha_phase_seconds", "Time spent per service phase", ("phase",))
+ROWS_SCANNED = metrics.Counter("fha_rows_scanned_total", "Store or rollup rows read to answer requests", ("route",))
+ROWS_RETURNED = metrics.Counter("fha_rows_returned_total", "Timeseries rows in responses", ("route",))
+CACHE_REQUESTS = metrics.Counter("fha_response_cache_requests_total", "Cacheable requests by X-Cache result",
+                                 ("route", "result"))
+LOAD_SECONDS = metrics.Gauge("fha_dataset_load_seconds", "Duration of the latest load of each dataset",
+                             ("dataset", "source"))
+LOADS = metrics.Counter("fha_dataset_loads_total", "Dataset (re)loads", ("dataset", "source"))
+
+_trace = ContextVar("trace", default=None)
+
+
+class Trace:
+    """Phase durations and row counts for one request."""
+    __slots__ = ("phases", "scanned", "returned", "profiles")
+
+    def __init__(self, profile=False):
+        self.phases = {}
+        self.scanned = self.returned = 0
+        self.profiles = [] if profile else None
+
+    def server_timing(self, total):
+        parts = [f"{name};dur={s * 1e3:.2f}" for name, s in self.phases.items()]
+        return ", ".join(parts + [f"app;dur={total * 1e3:.2f}"])
+
+
+@contextmanager
+def phase(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        PHASE_SECONDS.observe(dt, phase=name)
+        trace = _trace.get()
+        if trace is not None:
+            trace.phases[name] = trace.phases.get(name, 0.0) + dt
+
+
+def rows(scanned=0, returned=0):
+    """Count rows read / sent for the current request."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.scanned += scanned
+        trace.returned += returned
+
+
+@contextmanager
+def load(dataset, source):
+    """Time a dataset (re)load: a ``load`` phase plus the dataset load metrics."""
+    t0 = time.perf_counter()
+    with phase("load"):
+        yield
+    LOAD_SECONDS.set(time.perf_counter() - t0, dataset=dataset, source=source)
+    LOADS.inc(dataset=dataset, source=source)
+
+
+def profiling():
+    trace = _trace.get()
+    return trace is not None and trace.profiles is not None
+
+
+def profiled(fn):
+    """``fn`` run under a profiler when the current request asked for one (call it in the
+    caller's context; the returned function may run on another thread)."""
+    trace = _trace.get()
+    if trace is None or trace.profiles is None:
+        return fn
+
+    def run(*args):
+        try:
+            from pyinstrument import Profiler  # optional: sampled call tree
+        except ImportError:
+            return _cprofile(trace, fn, args)
+        prof = Profiler(interval=PROFILE_INTERVAL, async_mode="disabled")
+        prof.start()
+        try:
+            return fn(*args)
+        finally:
+            prof.stop()
+            trace.profiles.append(prof.output_text(unicode=True, show_all=False))
+    return run
+
+
+def _cprofile(trace, fn, args):
+    import cProfile, pstats
+    prof = cProfile.Profile()
+    try:
+        return prof.runcall(fn, *args)
+    finally:
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(40)
+        trace.profiles.append(out.getvalue())
+
+
+def _route(scope, status):
+    # the path itself for routes without parameters (all of ours; a route's own path lacks its
+    # router's prefix), its template otherwise. Cache hits answer before routing and keep their
+    # path; anything else unrouted is a 404 and not worth a label each
+    route = getattr(scope.get("route"), "path", None)
+    if route and "{" in route:
+        return route
+    return scope["path"] if route or status != 404 else "unmatched"
+
+
+class TimingMiddleware:
+    """ASGI middleware recording request latency, rows and cache results per route,
+    adding a Server-Timing header, and answering ``?profile=1`` when enabled."""
+
+    def __init__(self, app, profile=PROFILE_REQUESTS):
+        self.app, self.profile = app, profile
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profile = False
+        if self.profile and scope.get("query_string"):
+            query = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+            profile = ("profile", "1") in query
+            if profile:
+                # the route never sees the flag, and the response cache neither serves nor stores the request
+                scope = {**scope, "query_string": urlencode([q for q in query if q[0] != "profile"]).encode(),
+                         PROFILE_SCOPE_KEY: True}
+        trace = Trace(profile)
+        token = _trace.set(trace)
+        t0 = time.perf_counter()
+        state = {"status": 500, "cache": None, "start": None}
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                headers = list(message.get("headers", []))
+                for k, v in headers:
+                    if k == b"x-cache":
+                        state["cache"] = v.decode("latin-1").lower()
+                headers.append((b"server-timing", trace.server_timing(time.perf_counter() - t0).encode()))
+                message["headers"] = headers
+                if profile:
+                    state["start"] = message
+                    return
+            elif profile:
+                if not message.get("more_body"):
+                    await self._report(send, trace, state["start"])
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            _trace.reset(token)
+            status, route = state["status"], _route(scope, state["status"])
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, route=route, method=scope["method"], status=status)
+            if trace.scanned or trace.returned:
+                ROWS_SCANNED.inc(trace.scanned, route=route)
+                ROWS_RETURNED.inc(trace.returned, route=route)
+            if state["cache"] is not None:
+                CACHE_REQUESTS.inc(route=route, result=state["cache"])
+
+    @staticmethod
+    async def _report(send, trace, start):
+        status = start["status"] if start else 500
+        timing = next((v for k, v in start["headers"] if k == b"server-timing"), b"") if start else b""
+        head = f"status: {status}\nserver-timing: {timing.decode()}\nrows scanned: {trace.scanned}, " \
+               f"returned: {trace.returned}\n\n"
+        body = (head + ("\n".join(trace.profiles) or "no off-loop work was profiled (cached or coalesced?)\n")).encode()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"server-timing", timing),
+                                (b"x-profiled-status", str(status).encode())]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,98 @@
+"""Versioned on-disk snapshots shared by every worker process.
+
+A snapshot root holds numbered version directories plus a ``CURRENT``
+file naming the live one:
+
+    store/CURRENT        "v000007"
+    store/v000007/...    written by whoever published it
+    store/.lock          flock held while building or publishing
+
+Publishing writes the new version under a temporary name, renames it into
+place, then replaces ``CURRENT`` with ``os.replace`` -- readers see either
+the old version or the new one, never a partial write. Versions older than
+the previous one are removed unless the publisher asks to keep them (a
+version may build on earlier ones); processes still mapping them keep
+their pages until they remap, as unlinked files stay readable on POSIX.
+"""
+import json, os, shutil, uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: single-process use only there
+    fcntl = None
+
+CURRENT = "CURRENT"
+META = "meta.json"
+
+
+def current(root):
+    """Name of the live version, or None if nothing has been published."""
+    try:
+        with open(os.path.join(root, CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def meta(root, name):
+    with open(os.path.join(root, name, META)) as f:
+        return json.load(f)
+
+
+@contextmanager
+def locked(root):
+    """Exclusive cross-process lock on ``root`` for building or publishing."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def publish(root, write, info, keep=()):
+    """Write a new version with ``write(directory)`` and make it current; returns its name.
+
+    ``info`` is stored as the version's meta.json; versions named in ``keep``
+    survive the cleanup. Call with ``locked(root)`` held.
+    """
+    os.makedirs(root, exist_ok=True)
+    for entry in os.listdir(root):
+        if entry.startswith(".tmp-"):  # left behind by a writer that died mid-publish
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+    names = sorted(n for n in os.listdir(root) if n.startswith("v") and n[1:].isdigit())
+    name = "v%06d" % (int(names[-1][1:]) + 1 if names else 1)
+    tmp = os.path.join(root, f".tmp-{uuid.uuid4().hex}")
+    os.makedirs(tmp)
+    write(tmp)
+    with open(os.path.join(tmp, META), "w") as f:
+        json.dump(info, f)
+    for dirpath, dirnames, filenames in os.walk(tmp, topdown=False):
+        for entry in filenames:
+            with open(os.path.join(dirpath, entry), "rb") as f:
+                os.fsync(f.fileno())
+        if dirpath != tmp:
+            _fsync_dir(dirpath)
+    os.rename(tmp, os.path.join(root, name))
+    with open(os.path.join(root, CURRENT + ".tmp"), "w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(os.path.join(root, CURRENT + ".tmp"), os.path.join(root, CURRENT))
+    _fsync_dir(root)
+    for old in names[:-1]:  # keep the version just replaced, drop anything older
+        if old not in keep:
+            shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return name
@@ -0,0 +1,52 @@
+"""Vectorized PM2.5 -> AQI / category throughput vs the old scalar loop.
+
+    PYTHONPATH=backend python benchmarks/aqi_throughput.py [--sizes 1e6 1e7 5e7]
+
+The scalar baseline is the per-reading breakpoint loop the seed script
+used; it only runs on the first 100k readings and is extrapolated.
+"""
+import argparse, time
+import numpy as np
+from app.utils import aqi
+
+BREAKPOINTS = [(0.0, 12.0, 0, 50), (12.1, 35.4, 51, 100), (35.5, 55.4, 101, 150), (55.5, 150.4, 151, 200),
+               (150.5, 250.4, 201, 300), (250.5, 350.4, 301, 400), (350.5, 500.4, 401, 500)]
+SCALAR_N = 100_000
+
+
+def _scalar(pm25):
+    for c_lo, c_hi, i_lo, i_hi in BREAKPOINTS:
+        if pm25 <= c_hi:
+            return round((i_hi - i_lo) / (c_hi - c_lo) * (pm25 - c_lo) + i_lo)
+    return 500
+
+
+def _rate(fn, n):
+    t0 = time.perf_counter()
+    fn()
+    return n / (time.perf_counter() - t0)
+
+
+def run(n, seed=0):
+    pm25 = np.round(np.random.default_rng(seed).lognormal(2.3, 0.8, n), 1)
+    values = aqi.pm25_to_aqi(pm25)
+    head = pm25[:SCALAR_N].tolist()
+    # on the 0.1 grid the old loop and the shared module must agree
+    assert np.array_equal([_scalar(v) for v in head], values[:SCALAR_N]), "pm25_to_aqi disagrees with the breakpoint loop"
+    return {"aqi/s": _rate(lambda: aqi.pm25_to_aqi(pm25), n),
+            "category/s": _rate(lambda: aqi.category_codes(values), n),
+            "scalar aqi/s": _rate(lambda: [_scalar(v) for v in head], len(head))}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", nargs="+", type=float, default=[1e6, 1e7, 5e7])
+    args = ap.parse_args()
+    print(f"{'n':>10} {'aqi M/s':>9} {'category M/s':>13} {'scalar M/s':>11}")
+    for n in args.sizes:
+        r = run(int(n))
+        print(f"{int(n):>10} {r['aqi/s'] / 1e6:>9.1f} {r['category/s'] / 1e6:>13.1f} {r['scalar aqi/s'] / 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Helpers shared by the benchmark scripts: timing, percentiles and memory."""
+import resource, statistics, sys, time
+
+
+def timed(fn, *args, repeat=5):
+    """(first call ms, median ms of ``repeat`` further calls, min ms). The first call pays any lazy builds."""
+    t0 = time.perf_counter()
+    fn(*args)
+    first = (time.perf_counter() - t0) * 1e3
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        runs.append((time.perf_counter() - t0) * 1e3)
+    return {"first_ms": first, "median_ms": statistics.median(runs), "min_ms": min(runs)}
+
+
+def percentiles(ms, qs=(50, 95, 99)):
+    """{"p50": ..., ...} of a list of latencies (nearest-rank)."""
+    if not ms:
+        return {f"p{q}": None for q in qs}
+    s = sorted(ms)
+    return {f"p{q}": s[min(len(s) - 1, max(0, -(-q * len(s) // 100) - 1))] for q in qs}
+
+
+def rss_mb():
+    """(current, peak) resident set size in MB; current is None where /proc isn't available."""
+    current = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return current, peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
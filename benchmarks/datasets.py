@@ -0,0 +1,68 @@
+"""Synthetic datasets for the benchmarks, built with the seed scripts and cached.
+
+    python benchmarks/datasets.py [--sizes small medium large 30x10]
+
+A size is a name from SIZES or ``<days>x<sensors per zip>``; readings are
+hourly over the seed's 3 zips, so ``730x40`` is about 2.1M rows. Each one
+is a DATA_DIR under ``benchmarks/.data/<size>/`` with the seed's raw/ and
+processed/ layout; it is built once and reused until deleted.
+"""
+import argparse, pathlib, shutil, subprocess, sys
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+SCRIPTS = ROOT / "data_generation" / "scripts"
+CACHE = pathlib.Path(__file__).resolve().parent / ".data"
+SIZES = {"small": (7, 6), "medium": (90, 20), "large": (730, 40)}
+ZIPS = 3
+
+
+def parse(size):
+    """(days, sensors per zip) for a size name or spec."""
+    if size in SIZES:
+        return SIZES[size]
+    try:
+        days, per_zip = (int(v) for v in size.split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"size must be one of {', '.join(SIZES)} or <days>x<sensors per zip>")
+    return days, per_zip
+
+
+def rows(size):
+    days, per_zip = parse(size)
+    return (days * 24 + 1) * ZIPS * per_zip
+
+
+def generate(days, per_zip, data_dir):
+    """Run the seed scripts into ``data_dir``; returns the timeseries CSV path."""
+    raw, csv = data_dir / "raw", data_dir / "processed" / "aqi_timeseries.csv"
+    subprocess.run([sys.executable, SCRIPTS / "gen_sensors.py", "--per-zip", str(per_zip),
+                    "--out", raw / "sensors_seed.csv"], check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([sys.executable, SCRIPTS / "gen_timeseries.py", "--days", str(days),
+                    "--sensors", raw / "sensors_seed.csv", "--out", csv], check=True, stdout=subprocess.DEVNULL)
+    shutil.copy(ROOT / "data" / "raw" / "zip_shapes.geojson", raw / "zip_shapes.geojson")
+    return csv
+
+
+def ensure(size):
+    """DATA_DIR for ``size``, generating it on first use."""
+    data_dir = CACHE / size
+    if not (data_dir / "processed" / "aqi_timeseries.csv").exists():
+        tmp = CACHE / f".tmp-{size}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        generate(*parse(size), tmp)
+        shutil.rmtree(data_dir, ignore_errors=True)
+        tmp.rename(data_dir)
+    return data_dir
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", nargs="+", default=list(SIZES))
+    args = ap.parse_args()
+    for size in args.sizes:
+        parse(size)
+        print(f"{size:>10} {rows(size):>10} rows  {ensure(size)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Throughput of the synthetic data generators, in rows/s.
+
+    PYTHONPATH=backend python benchmarks/generators.py [--days 30] [--per-zip 10] [--json]
+
+Times the seed scripts (gen_sensors + gen_timeseries, the CSV the memory
+backend reads) and generate_air_quality_data.py writing Parquet, each into
+a temporary directory.
+"""
+import argparse, json, pathlib, subprocess, sys, tempfile, time
+import datasets
+
+GENERATOR = datasets.ROOT / "data_generation" / "generate_air_quality_data.py"
+
+
+def _time(cmd):
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, *map(str, cmd)], check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+
+def run(days=30, per_zip=10, sensors=100, interval=10):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+        t0 = time.perf_counter()
+        datasets.generate(days, per_zip, tmp / "seed")
+        seed_s = time.perf_counter() - t0
+        seed_rows = (days * 24 + 1) * datasets.ZIPS * per_zip
+        # pinned --end so every run generates the same readings
+        aq_s = _time([GENERATOR, "--sensors", sensors, "--days", days, "--interval", interval,
+                      "--end", "2025-01-01T00:00", "--format", "parquet", "--out", tmp / "aq.parquet", "--no-upload"])
+        aq_rows = sensors * days * 24 * 60 // interval
+    return {"seed": {"rows": seed_rows, "seconds": seed_s, "rows_per_s": seed_rows / seed_s},
+            "air_quality": {"rows": aq_rows, "seconds": aq_s, "rows_per_s": aq_rows / aq_s}}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--per-zip", type=int, default=10, help="seed sensors per zip")
+    ap.add_argument("--sensors", type=int, default=100, help="generate_air_quality_data.py sensors")
+    ap.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = ap.parse_args()
+    r = run(args.days, args.per_zip, args.sensors)
+    if args.json:
+        print(json.dumps(r))
+        return
+    print(f"{'generator':>12} {'rows':>10} {'s':>7} {'k rows/s':>9}")
+    for name, v in r.items():
+        print(f"{name:>12} {v['rows']:>10} {v['seconds']:>7.2f} {v['rows_per_s'] / 1e3:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""In-process load test of the FastAPI app: latency percentiles, throughput, cache hits and RSS.
+
+    PYTHONPATH=backend python benchmarks/load.py [--size small] [--concurrency 16] [--requests 2000] [--json]
+
+Runs the app (lifespan and warm-up included; ``startup_ms`` is the time
+until it reports ready) on an httpx ASGITransport, so there is no
+socket or server process in the numbers, and drives it from
+``--concurrency`` client tasks with a weighted mix of dashboard requests.
+Windows end on one of the dataset's last ``--distinct`` hours, which sets
+how often the response cache can answer. Latencies are per request, from
+send to the full body read.
+"""
+import argparse, asyncio, json, random, sys, tempfile, time
+from collections import defaultdict
+import datasets, services
+from common import percentiles, rss_mb
+
+HOUR = 3600
+
+
+def _iso(t):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+
+
+def _window(rng, t1, hours, distinct):
+    end = t1 - rng.randrange(distinct) * HOUR
+    return f"start={_iso(end - hours * HOUR)}&end={_iso(end)}"
+
+
+# (name, weight, path builder(rng, last reading epoch s, zips, distinct))
+MIX = [
+    ("aqi-summary day", 30, lambda r, t1, z, d: f"/api/v1/aqi-summary?{_window(r, t1, 24, d)}"),
+    ("aqi-summary week zip", 15, lambda r, t1, z, d: f"/api/v1/aqi-summary?{_window(r, t1, 168, d)}&zip={r.choice(z)}"),
+    ("aqi-summary month 1h", 10, lambda r, t1, z, d: f"/api/v1/aqi-summary?{_window(r, t1, 720, d)}&bucket=1h"),
+    ("map-summary week", 20, lambda r, t1, z, d: f"/api/v1/map-summary?{_window(r, t1, 168, d)}"),
+    ("geojson", 10, lambda r, t1, z, d: f"/api/v1/geojson?zoom={r.randrange(8, 14)}"),
+    ("sensor-counts", 10, lambda r, t1, z, d: f"/api/v1/sensor-counts?zip={r.choice(z)}"),
+    ("sensors", 5, lambda r, t1, z, d: f"/api/v1/sensors?zip={r.choice(z)}"),
+]
+
+
+async def _drive(app, concurrency, n, distinct, seed):
+    import httpx
+    from app.services import timeseries
+    store = timeseries.get_store()
+    t1, zips = int(store.ts.max()) // 1_000_000_000, [str(z) for z in store.zips]
+    rng = random.Random(seed)
+    build = {name: path for name, _, path in MIX}
+    plan = [(name, build[name](rng, t1, zips, distinct))
+            for name in rng.choices(list(build), [w for _, w, _ in MIX], k=n)]
+    latencies, errors = defaultdict(list), defaultdict(int)
+    todo = iter(plan)
+
+    async def client(c):
+        for name, path in todo:
+            t = time.perf_counter()
+            resp = await c.get(path)
+            latencies[name].append((time.perf_counter() - t) * 1e3)
+            if resp.status_code != 200:
+                errors[f"{name} {resp.status_code}"] += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        before = _counters((await c.get("/stats")).json())
+        t = time.perf_counter()
+        await asyncio.gather(*(client(c) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t
+        after = _counters((await c.get("/stats")).json())
+    return latencies, dict(errors), elapsed, {k: after[k] - before[k] for k in after}
+
+
+def _counters(stats):
+    routes = stats["queues"]["routes"].values()
+    return {"hits": stats["cache"]["hits"], "misses": stats["cache"]["misses"],
+            "coalesced": sum(g["coalesced"] for g in routes), "rejected": sum(g["rejected"] for g in routes)}
+
+
+async def _main(size, concurrency, n, distinct, seed):
+    from app.main import app
+    from app.services import warmup
+    t = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        while not warmup.readiness.ready and warmup.readiness.error is None:  # what /ready reports
+            await asyncio.sleep(0.005)
+        startup_ms = (time.perf_counter() - t) * 1e3
+        # the first pass warms lazy builds (rollups, geojson zooms) and is not reported
+        await _drive(app, concurrency, min(n, 200), distinct, seed + 1)
+        app.state.response_cache.clear()
+        latencies, errors, elapsed, counts = await _drive(app, concurrency, n, distinct, seed)
+    everything = [ms for v in latencies.values() for ms in v]
+    rss, peak = rss_mb()
+    return {"size": size, "concurrency": concurrency, "requests": n, "distinct_hours": distinct,
+            "startup_ms": startup_ms, "seconds": elapsed, "rps": n / elapsed, "errors": errors,
+            "latency_ms": {"all": percentiles(everything),
+                           **{name: {**percentiles(v), "n": len(v)} for name, v in sorted(latencies.items())}},
+            "cache_hit_rate": counts["hits"] / max(1, counts["hits"] + counts["misses"]),
+            "coalesced": counts["coalesced"], "rejected": counts["rejected"],
+            "rss_mb": rss, "peak_rss_mb": peak}
+
+
+def run(size, concurrency=16, n=2000, distinct=48, seed=0):
+    with tempfile.TemporaryDirectory() as store_dir:
+        services.setup(size, store_dir)
+        return asyncio.run(_main(size, concurrency, n, distinct, seed))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", default="small", type=lambda s: datasets.parse(s) and s)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--distinct", type=int, default=48, help="distinct window end hours (fewer -> more cache hits)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = ap.parse_args()
+    r = run(args.size, args.concurrency, args.requests, args.distinct, args.seed)
+    if args.json:
+        json.dump(r, sys.stdout)
+        return
+    print(f"{r['size']}: {r['requests']} requests x{r['concurrency']} in {r['seconds']:.2f}s = {r['rps']:.0f} req/s; "
+          f"cache hits {r['cache_hit_rate']:.0%}, coalesced {r['coalesced']}, startup {r['startup_ms']:.0f} ms, "
+          f"rss {r['rss_mb']:.0f} MB (peak {r['peak_rss_mb']:.0f})")
+    if r["errors"]:
+        print("errors:", r["errors"])
+    print(f"{'route':>22} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, p in r["latency_ms"].items():
+        print(f"{name:>22} {p.get('n', r['requests']):>6} {p['p50']:>8.2f} {p['p95']:>8.2f} {p['p99']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Run the benchmark suite and save the results as JSON (``make bench``).
+
+    PYTHONPATH=backend python benchmarks/run.py [--sizes small medium] [--compare benchmarks/results/<old>.json]
+
+For each dataset size (see benchmarks/datasets.py) services.py and load.py
+run in their own process, since the app reads DATA_DIR on import and RSS
+should not carry over between sizes; generators.py runs once. Results go
+to ``benchmarks/results/<UTC timestamp>.json`` (or ``--out``) with the
+commit and machine they were measured on. ``--compare`` prints each
+metric's ratio against an earlier results file (new / old; for latencies
+and load times lower is better).
+"""
+import argparse, json, os, pathlib, platform, subprocess, sys, time
+import datasets
+
+HERE = pathlib.Path(__file__).resolve().parent
+RESULTS = HERE / "results"
+
+
+def _child(script, *args):
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(datasets.ROOT / "backend"),
+                                                                    os.environ.get("PYTHONPATH")]))}
+    out = subprocess.run([sys.executable, str(HERE / script), *map(str, args), "--json"],
+                         check=True, stdout=subprocess.PIPE, env=env, text=True).stdout
+    return json.loads(out)
+
+
+def _environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=datasets.ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+
+
+def _flatten(r, prefix=""):
+    """{"sizes.small.services.cases.geojson.median_ms": 0.01, ...} for the numeric leaves."""
+    out = {}
+    for k, v in r.items():
+        if isinstance(v, dict):
+            out.update(_flatten(v, f"{prefix}{k}."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[prefix + k] = v
+    return out
+
+
+METRICS = ("median_ms", "p50", "p95", "p99", "rps", "rows_per_s", "csv_ms", "snapshot_ms", "startup_ms", "peak_rss_mb")
+
+
+def compare(new, old):
+    a, b = _flatten(new), _flatten(old)
+    print(f"{'metric':>72} {'old':>10} {'new':>10} {'new/old':>8}")
+    for k in sorted(a.keys() & b.keys()):
+        if k.rsplit(".", 1)[-1] in METRICS and b[k]:
+            print(f"{k:>72} {b[k]:>10.2f} {a[k]:>10.2f} {a[k] / b[k]:>8.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", nargs="+", default=["small", "medium", "large"])
+    ap.add_argument("--repeat", type=int, default=5, help="calls per service case")
+    ap.add_argument("--requests", type=int, default=2000, help="load-test requests per size")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--out", type=pathlib.Path, default=None)
+    ap.add_argument("--compare", type=pathlib.Path, default=None, help="earlier results file to compare against")
+    args = ap.parse_args()
+    for size in args.sizes:
+        datasets.parse(size)
+
+    results = {"environment": _environment(), "generators": _child("generators.py"), "sizes": {}}
+    for size in args.sizes:
+        print(f"{size}: {datasets.rows(size)} rows", file=sys.stderr)
+        datasets.ensure(size)
+        results["sizes"][size] = {
+            "rows": datasets.rows(size),
+            "services": _child("services.py", "--size", size, "--repeat", args.repeat),
+            "load": _child("load.py", "--size", size, "--requests", args.requests, "--concurrency", args.concurrency),
+        }
+
+    out = args.out or RESULTS / f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=1))
+    for size, r in results["sizes"].items():
+        s, l = r["services"], r["load"]
+        print(f"{size:>8} {r['rows']:>9} rows  csv load {s['load']['csv_ms']:>7.0f} ms  "
+              f"aqi_summary week {s['cases']['aqi_summary week']['median_ms']:>7.2f} ms  "
+              f"load p50/p95/p99 {l['latency_ms']['all']['p50']:.1f}/{l['latency_ms']['all']['p95']:.1f}/"
+              f"{l['latency_ms']['all']['p99']:.1f} ms  {l['rps']:.0f} req/s  peak rss {l['peak_rss_mb']:.0f} MB")
+    print(f"wrote {out}")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
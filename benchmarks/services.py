@@ -0,0 +1,96 @@
+"""Service-function latency on a synthetic dataset: store load, summaries, map, counts, geojson.
+
+    PYTHONPATH=backend python benchmarks/services.py [--size small] [--repeat 5] [--json]
+
+Calls the service functions directly (no HTTP, no response cache) with
+the memory backend over the dataset from benchmarks/datasets.py. Windows
+are the last day, the last week and the whole range. Each case reports
+its first call, which pays for lazy builds such as rollup tables and
+geojson encodings, then the median and min of ``--repeat`` more calls.
+"""
+import argparse, json, os, sys, tempfile, time
+import datasets
+from common import rss_mb, timed
+
+
+def setup(size, store_dir):
+    """Point the app at ``size``'s dataset; call before importing app.services (they read DATA_DIR on import).
+
+    The store snapshot goes to ``store_dir`` so every run measures the same cold CSV build.
+    """
+    data_dir = datasets.ensure(size)
+    os.environ.update(DATA_DIR=str(data_dir), STORAGE_BACKEND="memory", STORE_SNAPSHOT_DIR=str(store_dir))
+    return data_dir
+
+
+def _cases(t0, t1, zip):
+    from datetime import datetime, timedelta, timezone
+    from app.api.v1.routes import _json
+    from app.services import aqi_summary, geojson, map_summary, sensor_counts
+    end = datetime.fromtimestamp(t1 / 1e9, timezone.utc)
+    day, week, full = end - timedelta(days=1), end - timedelta(days=7), datetime.fromtimestamp(t0 / 1e9, timezone.utc)
+    return [
+        ("aqi_summary day", aqi_summary.get_summary, (day, end)),
+        ("aqi_summary week", aqi_summary.get_summary, (week, end)),
+        ("aqi_summary all", aqi_summary.get_summary, (full, end)),
+        ("aqi_summary week zip", aqi_summary.get_summary, (week, end, zip)),
+        ("aqi_summary all json", _json, (aqi_summary.get_summary, full, end)),
+        ("aqi_summary all bucket=1h", aqi_summary.get_summary, (full, end, None, "1h")),
+        ("aqi_summary all bucket=1d", aqi_summary.get_summary, (full, end, None, "1d")),
+        ("aqi_summary all max_points=500", aqi_summary.get_summary, (full, end, zip, None, "mean", 500)),
+        ("aqi_summary all columnar", aqi_summary.get_columnar, (full, end)),
+        ("map_summary day", map_summary.get_map_summary, (day, end)),
+        ("map_summary all", map_summary.get_map_summary, (full, end)),
+        ("sensor_counts all", sensor_counts.get_counts, (None,)),
+        ("sensor_counts zip", sensor_counts.get_counts, ([zip],)),
+        ("geojson", geojson.get_encoded, ()),
+        ("geojson zoom=10", geojson.get_encoded, (10,)),
+    ]
+
+
+def run(size, repeat=5):
+    with tempfile.TemporaryDirectory() as store_dir:
+        return _run(size, repeat, setup(size, store_dir))
+
+
+def _run(size, repeat, data_dir):
+    import pandas  # noqa: F401  the services import it lazily; keep the import out of csv_ms
+    from app.services import timeseries
+    t = time.perf_counter()
+    store = timeseries.TimeseriesStore.from_csv(timeseries.CSV)
+    load = {"csv_ms": (time.perf_counter() - t) * 1e3, "rows": len(store)}
+    with tempfile.TemporaryDirectory() as tmp:
+        store.save(tmp)
+        t = time.perf_counter()
+        timeseries.TimeseriesStore.load(tmp)
+        load["snapshot_ms"] = (time.perf_counter() - t) * 1e3
+    t = time.perf_counter()
+    store = timeseries.get_store()  # the one the services use: CSV build plus snapshot write
+    load["get_store_ms"] = (time.perf_counter() - t) * 1e3
+    cases = {}
+    for name, fn, args in _cases(int(store.ts.min()), int(store.ts.max()), str(store.zips[0])):
+        cases[name] = timed(fn, *args, repeat=repeat)
+    rss, peak = rss_mb()
+    return {"size": size, "data_dir": str(data_dir), "load": load, "cases": cases, "rss_mb": rss, "peak_rss_mb": peak}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", default="small", type=lambda s: datasets.parse(s) and s)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = ap.parse_args()
+    r = run(args.size, args.repeat)
+    if args.json:
+        json.dump(r, sys.stdout)
+        return
+    load = r["load"]
+    print(f"{r['size']}: {load['rows']} rows; csv load {load['csv_ms']:.0f} ms, snapshot load {load['snapshot_ms']:.1f} ms, "
+          f"peak rss {r['peak_rss_mb']:.0f} MB")
+    print(f"{'case':>32} {'first ms':>9} {'median ms':>10} {'min ms':>8}")
+    for name, c in r["cases"].items():
+        print(f"{name:>32} {c['first_ms']:>9.2f} {c['median_ms']:>10.2f} {c['min_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Sketch p95 vs exact numpy.quantile: relative error and time.
+
+    PYTHONPATH=backend python benchmarks/sketch_accuracy.py [--sizes 1e4 1e6 1e7]
+
+Each size draws lognormal pm25 readings (and their integer AQI), splits
+them into 1000 groups the way rollup rows split a window, sketches each
+group, then merges the groups and reads p95 back.
+"""
+import argparse, time
+import numpy as np
+from app.utils import sketch
+
+
+def _aqi(pm25):
+    # integer-valued AQI-like data: the real breakpoints are not needed here
+    return np.rint(np.minimum(pm25 * 4.2, 500))
+
+
+def _measure(values, groups, q, rng):
+    t0 = time.perf_counter()
+    exact = np.quantile(values, q)
+    t_exact = time.perf_counter() - t0
+    _, b, c = sketch.group_sketch(rng.integers(0, groups, len(values)), values)
+    t0 = time.perf_counter()
+    est = sketch.quantile(sketch.dense(b, c), q)
+    t_merge = time.perf_counter() - t0
+    return {"exact": exact, "sketch": est, "rel_err": abs(est - exact) / exact,
+            "t_exact_ms": t_exact * 1e3, "t_merge_ms": t_merge * 1e3, "triples": len(b)}
+
+
+def run(n, groups=1000, q=0.95, seed=0):
+    rng = np.random.default_rng(seed)
+    pm25 = rng.lognormal(2.3, 0.6, n)
+    return {"pm25": _measure(pm25, groups, q, rng), "aqi": _measure(_aqi(pm25), groups, q, rng)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", nargs="+", type=float, default=[1e4, 1e5, 1e6, 1e7])
+    args = ap.parse_args()
+    print(f"ALPHA={sketch.ALPHA} (documented relative error bound)")
+    print(f"{'n':>10} {'measure':>7} {'exact':>9} {'sketch':>9} {'rel_err':>9} "
+          f"{'exact ms':>9} {'merge+q ms':>10} {'triples':>8}")
+    for n in args.sizes:
+        for name, r in run(int(n)).items():
+            print(f"{int(n):>10} {name:>7} {r['exact']:>9.3f} {r['sketch']:>9.3f} {r['rel_err']:>9.2e} "
+                  f"{r['t_exact_ms']:>9.2f} {r['t_merge_ms']:>10.2f} {r['triples']:>8}")
+            assert r["rel_err"] <= sketch.ALPHA + 1e-9, "sketch exceeded its error bound"
+
+
+if __name__ == "__main__":
+    main()
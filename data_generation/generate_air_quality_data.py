@@ -1,12 +1,19 @@
 import os
+import sys
+import time
+import zlib
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import duckdb
-import pandas as pd
 import numpy as np
-import uuid
-from datetime import datetime, timedelta
-import dropbox
+import pyarrow as pa
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+from app.utils.aqi import pm25_to_aqi
+
 # -----------------
 # Load secrets from .env
 # -----------------
@@ -21,6 +28,10 @@ DROPBOX_ACCESS_TOKEN = os.getenv("DROPBOX_ACCESS_TOKEN")
 NUM_SENSORS = 30
 DAYS = 730  # Generate 2 years of data
 INTERVAL_MINUTES = 10
+SEED = 42
+CHUNK_ROWS = 2_000_000  # rows generated and written per step
+SHARD_SENSORS = 50  # sensors per part file with --workers
+ROW_GROUP_ROWS = 64_000  # per hive Parquet row group; smaller groups prune finer on Timestamp
 
 # Fresno ZIPs + coordinates
 fresno_zip_locations = {
@@ -47,167 +58,317 @@ monthly_pm25_ranges = {
     9: (20, 90), 10: (15, 60), 11: (10, 30), 12: (5, 20),
 }
 
+# (low, mode, high) per month, indexed by month - 1, for vectorized draws
+TEMP_TRI = np.array([(lo, (lo + hi) / 2, hi) for lo, hi in (monthly_temp_ranges[m] for m in range(1, 13))])
+PM25_TRI = np.array([(lo, (lo + hi) / 2, hi) for lo, hi in (monthly_pm25_ranges[m] for m in range(1, 13))])
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+
+SCHEMA = pa.schema([
+    ("Reading_ID", pa.int64()),
+    ("Sensor_ID", pa.dictionary(pa.int32(), pa.string())),
+    ("Longitude", pa.float64()),
+    ("Latitude", pa.float64()),
+    ("Zip_Code", pa.dictionary(pa.int32(), pa.string())),
+    ("Timestamp", pa.timestamp("us")),
+    ("Temperature", pa.float64()),
+    ("PM2_5", pa.float64()),
+    ("AQI", pa.int32()),
+    ("CIG_APX", pa.float64()),
+])
+
 # -----------------
 # AQI Calculation Function
 # -----------------
 def calculate_aqi(pm25_array):
-    result = []
-    for pm in pm25_array:
-        bp = [
-            (0.0, 12.0, 0, 50), (12.1, 35.4, 51, 100),
-            (35.5, 55.4, 101, 150), (55.5, 150.4, 151, 200),
-            (150.5, 250.4, 201, 300), (250.5, 350.4, 301, 400),
-            (350.5, 500.4, 401, 500)
-        ]
-        for Clow, Chigh, Ilow, Ihigh in bp:
-            if Clow <= pm <= Chigh:
-                aqi = ((Ihigh - Ilow) / (Chigh - Clow)) * (pm - Clow) + Ilow
-                result.append(round(aqi))
-                break
-        else:
-            result.append(500)  # Cap to 500 if PM2.5 is extremely high
-    return np.array(result)
+    # shared with the API and the seed scripts (backend/app/utils/aqi.py)
+    return pm25_to_aqi(pm25_array).astype(int)
 
 # -----------------
-# Generate Sensor Metadata
+# Per-sensor Random Streams
 # -----------------
-sensor_metadata = []
-zip_codes = list(fresno_zip_locations.keys())
+def sensor_rngs(seed, sensor_id):
+    """(metadata, temperature, pm2.5) generators seeded from (seed, sensor_id).
 
-for i in range(NUM_SENSORS):
-    zip_code = zip_codes[i % len(zip_codes)]
-    base_lat, base_lon = fresno_zip_locations[zip_code]
-    lat = round(base_lat + np.random.uniform(-0.005, 0.005), 6)
-    lon = round(base_lon + np.random.uniform(-0.005, 0.005), 6)
-    sensor_metadata.append({
-        "Sensor_ID": f"sensor_{i+1:02d}",
-        "Zip_Code": zip_code,
-        "Latitude": lat,
-        "Longitude": lon
-    })
+    Every sensor draws from its own streams, so a sensor's readings do not
+    depend on chunking, sharding or how many workers produced them.
+    """
+    ss = np.random.SeedSequence([seed, zlib.crc32(sensor_id.encode())])
+    return [np.random.default_rng(s) for s in ss.spawn(3)]
 
-sensor_df = pd.DataFrame(sensor_metadata)
+# -----------------
+# Generate Sensor Metadata
+# -----------------
+def make_sensors(num_sensors, seed):
+    zip_codes = np.array(list(fresno_zip_locations))
+    base = np.array(list(fresno_zip_locations.values()))
+    k = np.arange(num_sensors) % len(zip_codes)
+    width = max(2, len(str(num_sensors)))
+    ids = np.array([f"sensor_{i + 1:0{width}d}" for i in range(num_sensors)])
+    jitter = np.array([sensor_rngs(seed, sid)[0].uniform(-0.005, 0.005, 2) for sid in ids]).reshape(-1, 2)
+    return {
+        "Sensor_ID": ids,
+        "Zip_Code": zip_codes[k],
+        "Latitude": np.round(base[k, 0] + jitter[:, 0], 6),
+        "Longitude": np.round(base[k, 1] + jitter[:, 1], 6),
+    }
 
 # -----------------
 # Generate Timestamp Range
 # -----------------
-end_time = datetime.now().replace(minute=0, second=0, microsecond=0)
-start_time = end_time - timedelta(days=DAYS)
-timestamps = pd.date_range(start=start_time, end=end_time, freq=f'{INTERVAL_MINUTES}T')
+def make_timestamps(days, interval_minutes, end_time=None):
+    """Epoch-microsecond timestamps every ``interval_minutes`` over the ``days`` ending at ``end_time``.
+
+    Timestamps are naive UTC, which is how the backends read the column; an aware
+    ``end_time`` is converted, and the default is the current UTC hour.
+    """
+    if end_time is None:
+        end_time = datetime.now(timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    elif end_time.tzinfo is not None:
+        end_time = end_time.astimezone(timezone.utc).replace(tzinfo=None)
+    start_time = end_time - timedelta(days=days)
+    start = np.datetime64(start_time, "us").astype(np.int64)
+    n = int((end_time - start_time) / timedelta(minutes=interval_minutes)) + 1
+    return start + np.arange(n, dtype=np.int64) * interval_minutes * 60_000_000
 
 # -----------------
-# Create DuckDB tables
+# Generate Readings
 # -----------------
-# Dynamically resolve path relative to script location
+def _triangular(rngs, tri, months):
+    # one vectorized call per sensor and block, the monthly ranges broadcast per timestamp
+    lo, mode, hi = tri[months - 1].T
+    return np.stack([rng.triangular(lo, mode, hi) for rng in rngs])
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, "data")
-os.makedirs(DATA_DIR, exist_ok=True)
-
-db_path = os.path.join(DATA_DIR, "dummy_air_quality.duckdb")
-conn = duckdb.connect(db_path)
-
-conn.execute("DROP TABLE IF EXISTS air_quality")
-conn.execute("""
-CREATE TABLE air_quality (
-    Reading_ID VARCHAR,
-    Sensor_ID VARCHAR,
-    Longitude DOUBLE,
-    Latitude DOUBLE,
-    Zip_Code VARCHAR,
-    Timestamp TIMESTAMP,
-    Temperature DOUBLE,
-    PM2_5 DOUBLE,
-    AQI INTEGER,
-    CIG_APX DOUBLE
-)
-""")
-
-# -----------------
-# Generate & Insert Data Sensor by Sensor
-# -----------------
-print("🚀 Generating and inserting data...")
-
-for sensor in sensor_metadata:
-    all_timestamps = timestamps
-    n_rows = len(all_timestamps)
-
-    # Determine seasonal ranges for each timestamp's month
-    months = pd.Series(all_timestamps).dt.month.values
-
-    temp_array = np.array([
-        np.random.triangular(
-            monthly_temp_ranges[m][0],
-            (monthly_temp_ranges[m][0] + monthly_temp_ranges[m][1])/2,
-            monthly_temp_ranges[m][1]
-        ) for m in months
-    ])
-
-    # ✅ UPDATED PM2.5 generation logic (seasonal weighting)
-    pm25_array = np.array([
-        np.random.triangular(
-            monthly_pm25_ranges[m][0],
-            (monthly_pm25_ranges[m][0] + monthly_pm25_ranges[m][1])/2,
-            monthly_pm25_ranges[m][1]
-        ) for m in months
-    ])
-
-    aqi_array = calculate_aqi(pm25_array)
-    cig_array = np.round(aqi_array / 22, 2)
-
-    batch_df = pd.DataFrame({
-        "Reading_ID": [str(uuid.uuid4()) for _ in range(n_rows)],
-        "Sensor_ID": sensor['Sensor_ID'],
-        "Longitude": sensor['Longitude'],
-        "Latitude": sensor['Latitude'],
-        "Zip_Code": sensor['Zip_Code'],
-        "Timestamp": all_timestamps,
-        "Temperature": np.round(temp_array, 1),
-        "PM2_5": np.round(pm25_array, 1),
-        "AQI": aqi_array.astype(int),
-        "CIG_APX": cig_array
-    })
-
-    # Insert directly into DuckDB
-    conn.register("batch_df", batch_df)
-    conn.execute("INSERT INTO air_quality SELECT * FROM batch_df")
-
-# -----------------
-# Create hourly aggregated table
-# -----------------
-conn.execute("DROP TABLE IF EXISTS air_quality_hourly")
-conn.execute("""
-CREATE TABLE air_quality_hourly AS
-SELECT 
-    Sensor_ID,
-    Zip_Code,
-    Longitude,
-    Latitude,
-    DATE_TRUNC('hour', Timestamp) AS Hour_Timestamp,
-    AVG(Temperature) AS Avg_Temp,
-    AVG(PM2_5) AS Avg_PM2_5,
-    AVG(AQI) AS Avg_AQI,
-    AVG(CIG_APX) AS Avg_CIG_APX
-FROM air_quality
-GROUP BY Sensor_ID, Zip_Code, Longitude, Latitude, Hour_Timestamp
-ORDER BY Hour_Timestamp
-""")
-
-conn.close()
-print("✅ Done! Production data generated successfully.")
+def generate_chunks(sensors, timestamps, seed, chunk_rows=CHUNK_ROWS, first=0, last=None):
+    """Yield pyarrow tables of about ``chunk_rows`` readings for sensors [first, last),
+    sensor block by time block."""
+    last = len(sensors["Sensor_ID"]) if last is None else last
+    n_ts = len(timestamps)
+    t_step = min(n_ts, chunk_rows)
+    s_step = max(1, chunk_rows // t_step)
+    months = timestamps.astype("datetime64[us]").astype("datetime64[M]").astype(np.int64) % 12 + 1
+    # dictionaries must be duplicate-free for the Parquet bytes to be deterministic
+    zips, zip_codes = np.unique(sensors["Zip_Code"], return_inverse=True)
+    for s0 in range(first, last, s_step):
+        s1 = min(s0 + s_step, last)
+        rngs = [sensor_rngs(seed, sid)[1:] for sid in sensors["Sensor_ID"][s0:s1]]
+        for t0 in range(0, n_ts, t_step):
+            t1 = min(t0 + t_step, n_ts)
+            shape = (s1 - s0, t1 - t0)
+            temp = np.round(_triangular([r[0] for r in rngs], TEMP_TRI, months[t0:t1]), 1)
+            pm25 = np.round(_triangular([r[1] for r in rngs], PM25_TRI, months[t0:t1]), 1)
+            aqi = calculate_aqi(pm25)
+            # deterministic row ids: sensor-major position in the full grid
+            ids = np.arange(s0, s1)[:, None] * n_ts + np.arange(t0, t1)
+            # per-sensor columns repeat block-wise; strings go in as dictionary codes
+            codes = np.repeat(np.arange(s0, s1, dtype=np.int32), shape[1])
+            yield pa.Table.from_arrays([
+                pa.array(ids.ravel()),
+                pa.DictionaryArray.from_arrays(codes, sensors["Sensor_ID"]),
+                pa.array(sensors["Longitude"][codes]),
+                pa.array(sensors["Latitude"][codes]),
+                pa.DictionaryArray.from_arrays(zip_codes[codes].astype(np.int32), zips),
+                pa.array(np.tile(timestamps[t0:t1], shape[0]), pa.timestamp("us")),
+                pa.array(temp.ravel()),
+                pa.array(pm25.ravel()),
+                pa.array(aqi.ravel().astype(np.int32)),
+                pa.array(np.round(aqi / 22, 2).ravel()),
+            ], schema=SCHEMA)
 
 # -----------------
-# Upload to Dropbox (Parameterized)
+# Writers
+# -----------------
+def write_duckdb(chunks, db_path, parts=None):
+    """Load ``chunks`` (or, when given, the Parquet ``parts`` in order) into db_path."""
+    conn = duckdb.connect(db_path)
+    conn.execute("DROP TABLE IF EXISTS air_quality")
+    conn.execute("""
+    CREATE TABLE air_quality (
+        Reading_ID BIGINT,
+        Sensor_ID VARCHAR,
+        Longitude DOUBLE,
+        Latitude DOUBLE,
+        Zip_Code VARCHAR,
+        Timestamp TIMESTAMP,
+        Temperature DOUBLE,
+        PM2_5 DOUBLE,
+        AQI INTEGER,
+        CIG_APX DOUBLE
+    )
+    """)
+    rows = 0
+    if parts:
+        conn.execute("SET preserve_insertion_order = true")
+        conn.execute("INSERT INTO air_quality SELECT * FROM read_parquet(?)", [parts])
+        rows = conn.execute("SELECT count(*) FROM air_quality").fetchone()[0]
+    for chunk in chunks:
+        conn.register("chunk", chunk)
+        conn.execute("INSERT INTO air_quality SELECT * FROM chunk")
+        conn.unregister("chunk")
+        rows += chunk.num_rows
+
+    # -----------------
+    # Create hourly aggregated table
+    # -----------------
+    conn.execute("DROP TABLE IF EXISTS air_quality_hourly")
+    conn.execute("""
+    CREATE TABLE air_quality_hourly AS
+    SELECT
+        Sensor_ID,
+        Zip_Code,
+        Longitude,
+        Latitude,
+        DATE_TRUNC('hour', Timestamp) AS Hour_Timestamp,
+        AVG(Temperature) AS Avg_Temp,
+        AVG(PM2_5) AS Avg_PM2_5,
+        AVG(AQI) AS Avg_AQI,
+        AVG(CIG_APX) AS Avg_CIG_APX
+    FROM air_quality
+    GROUP BY Sensor_ID, Zip_Code, Longitude, Latitude, Hour_Timestamp
+    ORDER BY Hour_Timestamp
+    """)
+    conn.close()
+    return rows
+
+def _with_partitions(chunk):
+    # hive keys zip=/year=/month=; rows sorted by time so row-group Timestamp stats stay narrow
+    # (the zip dictionary is sorted, so its codes order like the zips)
+    zip_codes = chunk["Zip_Code"].combine_chunks().indices.to_numpy()
+    chunk = chunk.take(np.lexsort((chunk["Reading_ID"].to_numpy(), chunk["Timestamp"].to_numpy(), zip_codes)))
+    ts = chunk["Timestamp"].to_numpy().astype("datetime64[M]").astype(np.int64)
+    return (chunk.append_column("zip", chunk["Zip_Code"].cast(pa.string()))
+                 .append_column("year", pa.array((ts // 12 + 1970).astype(np.int16)))
+                 .append_column("month", pa.array((ts % 12 + 1).astype(np.int8))))
+
+def write_hive(chunks, out_dir, basename="part-{i}.parquet"):
+    """Hive-partitioned Parquet (zip=/year=/month=) with row-group statistics."""
+    import pyarrow.dataset as ds
+    rows = [0]
+
+    def batches():
+        for chunk in chunks:
+            rows[0] += chunk.num_rows
+            yield from _with_partitions(chunk).to_batches()
+
+    schema = SCHEMA.append(pa.field("zip", pa.string())).append(pa.field("year", pa.int16())) \
+                   .append(pa.field("month", pa.int8()))
+    # single-threaded so file contents do not depend on scheduling
+    ds.write_dataset(batches(), out_dir, schema=schema, format="parquet", partitioning=["zip", "year", "month"],
+                     partitioning_flavor="hive", basename_template=basename, use_threads=False,
+                     existing_data_behavior="overwrite_or_ignore", max_rows_per_group=ROW_GROUP_ROWS,
+                     min_rows_per_group=ROW_GROUP_ROWS // 2,
+                     file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"))
+    return rows[0]
+
+def write_parquet(chunks, path):
+    import pyarrow.parquet as pq
+    rows = 0
+    with pq.ParquetWriter(path, SCHEMA, compression="zstd") as writer:
+        for chunk in chunks:
+            writer.write_table(chunk)
+            rows += chunk.num_rows
+    return rows
+
 # -----------------
+# Parallel Part Files
+# -----------------
+def _clear_parts(out_dir):
+    # stale parts from an earlier (larger) run would otherwise be read back as data
+    os.makedirs(out_dir, exist_ok=True)
+    for root, _, files in os.walk(out_dir):
+        for name in files:
+            if name.startswith("part-") and name.endswith(".parquet"):
+                os.remove(os.path.join(root, name))
+
+def _write_part(task):
+    sensors, timestamps, seed, chunk_rows, first, last, path, hive = task
+    chunks = generate_chunks(sensors, timestamps, seed, chunk_rows, first, last)
+    if hive:
+        # every shard writes into the shared partition tree under its own file names
+        return write_hive(chunks, os.path.dirname(path), os.path.basename(path).replace(".parquet", "-{i}.parquet"))
+    return write_parquet(chunks, path)
+
+def write_parts(sensors, timestamps, seed, out_dir, workers, shard_sensors=SHARD_SENSORS, chunk_rows=CHUNK_ROWS,
+                hive=False):
+    """One Parquet part per shard of ``shard_sensors`` sensors, written by a process pool.
+
+    Shards (and so part files) depend only on shard_sensors, never on the
+    worker count, so the output is identical for any ``workers``.
+    """
+    _clear_parts(out_dir)
+    n = len(sensors["Sensor_ID"])
+    tasks = [(sensors, timestamps, seed, chunk_rows, a, min(a + shard_sensors, n),
+              os.path.join(out_dir, f"part-{a // shard_sensors:05d}.parquet"), hive) for a in range(0, n, shard_sensors)]
+    with ProcessPoolExecutor(workers) as pool:
+        rows = sum(pool.map(_write_part, tasks))
+    return [t[-1] for t in tasks], rows
 
-# Load destination path from .env
-DROPBOX_UPLOAD_PATH = os.getenv("DROPBOX_UPLOAD_PATH")
+# -----------------
+# Upload to Dropbox (Parameterized)
+# -----------------
+def upload(path):
+    # Load destination path from .env
+    DROPBOX_UPLOAD_PATH = os.getenv("DROPBOX_UPLOAD_PATH")
 
-if DROPBOX_ACCESS_TOKEN is None or DROPBOX_UPLOAD_PATH is None:
-    print("❌ Dropbox access token or upload path not found! Skipping upload.")
-else:
+    if os.path.isdir(path):  # --format hive, or parquet with --workers: a tree of part files
+        print(f"❌ {path} is a directory of part files; only single-file outputs are uploaded. Skipping upload.")
+        return
+    if DROPBOX_ACCESS_TOKEN is None or DROPBOX_UPLOAD_PATH is None:
+        print("❌ Dropbox access token or upload path not found! Skipping upload.")
+        return
+    import dropbox
     print(f"🔄 Uploading file to Dropbox path: {DROPBOX_UPLOAD_PATH}")
     dbx = dropbox.Dropbox(DROPBOX_ACCESS_TOKEN)
-    with open(db_path, "rb") as f:
+    with open(path, "rb") as f:
         dbx.files_upload(f.read(), DROPBOX_UPLOAD_PATH, mode=dropbox.files.WriteMode.overwrite)
     print("✅ Dropbox upload complete!")
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate synthetic air quality readings.")
+    ap.add_argument("--sensors", type=int, default=NUM_SENSORS)
+    ap.add_argument("--days", type=float, default=DAYS)
+    ap.add_argument("--interval", type=int, default=INTERVAL_MINUTES, help="minutes between readings")
+    ap.add_argument("--seed", type=int, default=SEED)
+    ap.add_argument("--end", type=datetime.fromisoformat, default=None,
+                    help="last timestamp, UTC unless it has an offset (default: the current UTC hour); "
+                         "fix it for reproducible output")
+    ap.add_argument("--format", choices=["duckdb", "parquet", "hive"], default="duckdb",
+                    help="hive: Parquet partitioned by zip=/year=/month= under --out")
+    ap.add_argument("--out", default=None, help="output path (default: data/dummy_air_quality.<format>)")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    ap.add_argument("--workers", type=int, default=None,
+                    help="generate Parquet part files in this many processes")
+    ap.add_argument("--shard-sensors", type=int, default=SHARD_SENSORS, help="sensors per part file")
+    ap.add_argument("--no-upload", action="store_true")
+    args = ap.parse_args()
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    out = args.out or os.path.join(DATA_DIR, "air_quality" if args.format == "hive" else f"dummy_air_quality.{args.format}")
+    sensors = make_sensors(args.sensors, args.seed)
+    timestamps = make_timestamps(args.days, args.interval, args.end)
+
+    print(f"🚀 Generating {args.sensors} sensors × {len(timestamps)} timestamps into {out}...")
+    t0 = time.perf_counter()
+    if args.workers:
+        # parquet/hive: ``out`` is the directory of parts; duckdb: parts are staged next to it, loaded, then removed
+        parts_dir = out if args.format != "duckdb" else out + ".parts"
+        parts, rows = write_parts(sensors, timestamps, args.seed, parts_dir, args.workers,
+                                  args.shard_sensors, args.chunk_rows, hive=args.format == "hive")
+        if args.format == "duckdb":
+            rows = write_duckdb([], out, parts)
+            shutil.rmtree(parts_dir)
+    else:
+        chunks = generate_chunks(sensors, timestamps, args.seed, args.chunk_rows)
+        if args.format == "hive":
+            _clear_parts(out)
+            rows = write_hive(chunks, out)
+        else:
+            rows = write_duckdb(chunks, out) if args.format == "duckdb" else write_parquet(chunks, out)
+    print(f"✅ Done! {rows:,} rows in {time.perf_counter() - t0:.1f}s.")
+
+    if not args.no_upload:
+        upload(out)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import sys
 import dropbox
 from dotenv import load_dotenv
 import streamlit as st
@@ -11,6 +12,9 @@ import requests
 import geopandas as gpd
 import json
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "backend"))
+from app.utils.aqi import categories
+
 
 
 # ---------------
@@ -249,15 +253,7 @@ with tab1:
         if filtered_df.empty:
             st.warning("No data available for selected filters.")
         else:
-            def categorize_aqi(aqi):
-                if aqi <= 50: return "Good"
-                elif aqi <= 100: return "Moderate"
-                elif aqi <= 150: return "Unhealthy (Sensitive)"
-                elif aqi <= 200: return "Unhealthy"
-                elif aqi <= 300: return "Very Unhealthy"
-                else: return "Hazardous"
-
-            filtered_df["AQI_Category"] = filtered_df["Avg_AQI"].apply(categorize_aqi)
+            filtered_df["AQI_Category"] = categories(filtered_df["Avg_AQI"])[0]
             cat_counts = filtered_df["AQI_Category"].value_counts().reset_index()
             cat_counts.columns = ["Category", "Count"]
 
@@ -426,17 +422,8 @@ with tab3:
         # Merge with GeoJSON shapes
         geo_gdf = geo_gdf.merge(zip_summary, left_on="Zip_Code", right_on="Zip_Code", how="left")
 
-        # Assign AQI color buckets
-        def aqi_color(aqi):
-            if pd.isna(aqi): return "#d3d3d3"
-            if aqi <= 50: return "#00e400"
-            elif aqi <= 100: return "#ffff00"
-            elif aqi <= 150: return "#ff7e00"
-            elif aqi <= 200: return "#ff0000"
-            elif aqi <= 300: return "#8f3f97"
-            else: return "#7e0023"
-
-        geo_gdf["Color"] = geo_gdf["Avg_AQI"].apply(aqi_color)
+        # Assign AQI color buckets (grey for zips without readings)
+        geo_gdf["Color"] = pd.Series(categories(geo_gdf["Avg_AQI"])[1], index=geo_gdf.index).fillna("#d3d3d3")
 
         # Prepare the GeoJSON interface
         geojson_interface = geo_gdf.set_index("Zip_Code").geometry.__geo_interface__
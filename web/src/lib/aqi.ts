@@ -1,7 +1,12 @@
 import { API_BASE } from "./config";
 
-export async function fetchGeoJSON() {
-  const res = await fetch(`${API_BASE}/geojson`, { cache: "no-store" });
+export async function fetchGeoJSON(zoom?: number) {
+  const url = new URL(`${API_BASE}/geojson`);
+  if (zoom !== undefined) {
+    url.searchParams.set("zoom", String(Math.round(zoom)));
+    url.searchParams.set("quantize", "true");
+  }
+  const res = await fetch(url, { cache: "no-cache" });
   if (!res.ok) throw new Error("Failed to load geojson");
   return res.json();
 }
@@ -15,7 +20,7 @@ export async function fetchAqiSummary(
   url.searchParams.set("start", startISO);
   url.searchParams.set("end", endISO);
   if (zip) url.searchParams.set("zip", zip);
-  const res = await fetch(url, { cache: "no-store" });
+  const res = await fetch(url, { cache: "no-cache" });
   if (!res.ok) throw new Error("Failed to load aqi");
   return res.json();
 }
@@ -23,7 +28,17 @@ export async function fetchAqiSummary(
 export async function fetchSensorCounts(zip: string) {
   const url = new URL(`${API_BASE}/sensor-counts`);
   url.searchParams.set("zip", zip);
-  const res = await fetch(url, { cache: "no-store" });
+  const res = await fetch(url, { cache: "no-cache" });
   if (!res.ok) throw new Error("Failed to load counts");
   return res.json();
 }
+
+// Pushes {zip, readings, hours} for each ingest flush instead of re-polling
+// /aqi-summary; returns a function that closes the stream.
+export function subscribeLive(zips: string[], onZip: (update: any) => void) {
+  const url = new URL(`${API_BASE}/live/events`);
+  zips.forEach((z) => url.searchParams.append("zip", z));
+  const source = new EventSource(url);
+  source.addEventListener("zip", (e) => onZip(JSON.parse((e as MessageEvent).data)));
+  return () => source.close();
+}